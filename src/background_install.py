@@ -0,0 +1,75 @@
+import asyncio
+import shutil
+import signal
+import subprocess
+import sys
+
+
+# commands that lower the CPU and I/O priority of the installer, used if available
+LOW_PRIORITY_PREFIXES = [
+    ['ionice', '-c', '3'],
+    ['nice', '-n', '19'],
+]
+
+# seconds between checks for a switch request while the framework is running
+SWITCH_POLL_INTERVAL = 0.5
+
+_switch_requested = False
+
+
+class BackgroundInstaller:
+    """Installs a pending update in a low priority process.
+
+    The worker is the launcher itself, started with --install-only, so it
+    goes through the same cleanup and installation steps as a normal boot.
+    """
+
+    def __init__(self, launcher, cwd):
+        self._launcher = launcher
+        self._cwd = cwd
+        self._process = None
+
+    def start(self):
+        command = [sys.executable, self._launcher, '--install-only']
+        for prefix in LOW_PRIORITY_PREFIXES:
+            if shutil.which(prefix[0]):
+                command = prefix + command
+
+        print('Installing update in the background')
+        self._process = subprocess.Popen(command, cwd=self._cwd)
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+    @property
+    def finished(self):
+        """True if the worker has exited successfully."""
+        return self._process is not None and self._process.poll() == 0
+
+    def reset(self):
+        self._process = None
+
+
+def request_switch(signum=None, frame=None):
+    """Asks the launcher to restart into the newest installed version.
+
+    Installed as the SIGUSR1 handler.
+    """
+    global _switch_requested
+    _switch_requested = True
+
+
+def install_switch_handler():
+    signal.signal(signal.SIGUSR1, request_switch)
+
+
+async def watch_switch_request(process):
+    """Supervisor task that stops the framework when a switch is requested."""
+    global _switch_requested
+    while not _switch_requested:
+        await asyncio.sleep(SWITCH_POLL_INTERVAL)
+
+    _switch_requested = False
+    print('Switching to the newest installed version')
+    await process.terminate()
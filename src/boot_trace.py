@@ -0,0 +1,186 @@
+import contextlib
+import functools
+import json
+import os
+import time
+
+
+# trace files are rotated when they grow larger than this
+MAX_TRACE_FILE_SIZE = 256 * 1024
+TRACE_FILE_BACKUPS = 2
+
+# the trace of the boot in progress, see begin_boot
+_current = None
+
+
+class Span:
+    """Timing of one phase of the boot.
+
+    Attributes:
+        name: Name of the phase.
+        depth: Nesting level, 0 for top level phases.
+        start: Seconds from the beginning of the boot.
+        duration: Length of the phase in seconds.
+        bytes: Amount of data processed in the phase, if applicable.
+        attributes: Additional information, e.g. the version being installed.
+    """
+    __slots__ = ('name', 'depth', 'start', 'duration', 'bytes', 'attributes')
+
+    def __init__(self, name, depth, start, attributes):
+        self.name = name
+        self.depth = depth
+        self.start = start
+        self.duration = 0.0
+        self.bytes = None
+        self.attributes = attributes
+
+    def as_dict(self):
+        record = {'name': self.name, 'depth': self.depth, 'start': self.start, 'duration': self.duration}
+        if self.bytes is not None:
+            record['bytes'] = self.bytes
+        record.update(self.attributes)
+        return record
+
+
+class BootTrace:
+    """Collects the timing of the phases of a single boot."""
+
+    def __init__(self, trace_file=None, print_summary=False, clock=time.monotonic):
+        self.trace_file = trace_file
+        self.print_summary = print_summary
+        self.started = time.time()
+        self.spans = []
+        self._clock = clock
+        self._origin = clock()
+        self._open = []
+
+    def elapsed(self):
+        return self._clock() - self._origin
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        span = Span(name, len(self._open), self.elapsed(), attributes)
+        self.spans.append(span)
+        self._open.append(span)
+        try:
+            yield span
+        finally:
+            self._open.pop()
+            span.duration = self.elapsed() - span.start
+
+    def mark(self, name, **attributes):
+        """Records an event without duration."""
+        self.spans.append(Span(name, len(self._open), self.elapsed(), attributes))
+
+    def add_bytes(self, count):
+        """Adds to the byte count of the innermost open span."""
+        if self._open:
+            span = self._open[-1]
+            span.bytes = (span.bytes or 0) + count
+
+    def summary(self):
+        """Formats the spans as a table.
+
+        >>> trace = BootTrace(clock=iter([0, 0, 0.5, 1.25, 1.25, 2]).__next__)
+        >>> with trace.span('install') as span:
+        ...     with trace.span('extract') as inner:
+        ...         inner.bytes = 1024
+        >>> print(trace.summary())
+        Phase                         Start [ms]   Time [ms]        Bytes
+        install                              0.0      1250.0
+          extract                          500.0       750.0         1024
+        total                                         2000.0
+        """
+        lines = ['{:<28} {:>11} {:>11} {:>12}'.format('Phase', 'Start [ms]', 'Time [ms]', 'Bytes')]
+        for span in self.spans:
+            lines.append('{:<28} {:>11.1f} {:>11.1f} {:>12}'.format(
+                '  ' * span.depth + span.name, span.start * 1000, span.duration * 1000,
+                '' if span.bytes is None else span.bytes).rstrip())
+        lines.append('{:<28} {:>11} {:>11.1f}'.format('total', '', self.elapsed() * 1000))
+        return '\n'.join(lines)
+
+    def write(self):
+        """Appends the spans to the trace file as json lines, rotating the file if needed."""
+        if self.trace_file is None:
+            return
+
+        try:
+            rotate(self.trace_file)
+            boot = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))
+            with open(self.trace_file, 'a') as f:
+                for span in self.spans:
+                    f.write(json.dumps(dict(span.as_dict(), boot=boot)) + '\n')
+                f.write(json.dumps({'boot': boot, 'name': 'total', 'depth': 0, 'start': 0.0,
+                                    'duration': self.elapsed()}) + '\n')
+        except IOError:
+            print('Failed to write boot trace')
+
+
+def rotate(trace_file, max_size=MAX_TRACE_FILE_SIZE, backups=TRACE_FILE_BACKUPS):
+    """Renames trace_file to trace_file.1 (and so on) if it's too large."""
+    try:
+        if os.stat(trace_file).st_size < max_size:
+            return
+    except FileNotFoundError:
+        return
+
+    for i in range(backups - 1, 0, -1):
+        older = '{}.{}'.format(trace_file, i)
+        if os.path.exists(older):
+            os.replace(older, '{}.{}'.format(trace_file, i + 1))
+    os.replace(trace_file, trace_file + '.1')
+
+
+def begin_boot(trace_file=None, print_summary=False, clock=time.monotonic):
+    """Starts tracing a boot, replacing the previous trace."""
+    global _current
+    _current = BootTrace(trace_file, print_summary, clock)
+    return _current
+
+
+def end_boot():
+    """Finishes tracing the boot in progress: stores it and prints the summary if requested."""
+    global _current
+    trace, _current = _current, None
+    if trace is None:
+        return
+
+    trace.write()
+    if trace.print_summary:
+        print(trace.summary())
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Measures a phase of the boot in progress.
+
+    Does nothing but provide a Span to fill in if no boot is being traced.
+    """
+    if _current is None:
+        yield Span(name, 0, 0.0, attributes)
+    else:
+        with _current.span(name, **attributes) as s:
+            yield s
+
+
+def mark(name, **attributes):
+    """Records an event of the boot in progress."""
+    if _current is not None:
+        _current.mark(name, **attributes)
+
+
+def add_bytes(count):
+    """Adds to the byte count of the current phase of the boot in progress."""
+    if _current is not None:
+        _current.add_bytes(count)
+
+
+def traced(name):
+    """Decorator that measures every call of a function as a phase of the boot."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
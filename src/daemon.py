@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import time
+
+from inotify import IN_CLOSE_WRITE, IN_MOVED_TO, Inotify
+
+
+# seconds between checks for an update package if inotify is not available
+UPDATE_POLL_INTERVAL = 2.0
+
+# files of the update package, see has_update_package
+UPDATE_FILES = ('2.data', '2.meta')
+
+
+def update_package_complete(directory):
+    """Checks that both files of an update package are present and the data file is complete.
+
+    Unlike has_update_package, nothing is deleted, since the upload may still
+    be in progress.
+    """
+    try:
+        with open(os.path.join(directory, '2.meta'), 'r') as f:
+            metadata = json.load(f)
+        return metadata['length'] == os.stat(os.path.join(directory, '2.data')).st_size
+    except (IOError, ValueError, KeyError, TypeError):
+        return False
+
+
+class Daemon:
+    """State and control interface of a launcher that keeps running.
+
+    Detects update packages as soon as they are uploaded, and installs them
+    with the BackgroundInstaller. Accepts commands on a Unix socket, one per
+    line, and answers each with a line of json:
+
+    - status: The running version and the state of the installer.
+    - install-now: Installs the pending update package.
+    - restart: Restarts the framework, with the newest installed version.
+    - skip-version: Restarts the framework, skipping the running version.
+    - metrics: Counters and timings of the launcher.
+
+    The watcher and the server run on the event loop of the Supervisor, so
+    they are served while the framework runs. The launcher waits with sleep
+    and call_blocking, so that they are also served while it waits for
+    AMP_EN, for the devices to be ready, or before restarting the framework.
+
+    Args:
+        data_directory: Directory path the update package is uploaded to.
+        socket_path: Path of the control socket.
+        installer: BackgroundInstaller of the launcher.
+        skipped_versions: List of skipped version paths of the launcher,
+            skip-version adds to it.
+    """
+
+    def __init__(self, data_directory, socket_path, installer, skipped_versions):
+        self.data_directory = data_directory
+        self.socket_path = socket_path
+        self.installer = installer
+        self.skipped_versions = skipped_versions
+        self.path = None
+        self.process = None
+        self.started = time.monotonic()
+        self.counters = {
+            'framework_starts': 0,
+            'updates_detected': 0,
+            'installs_started': 0,
+            'commands': 0
+        }
+        self._stop = None
+        self._supervisor = None
+        self._inotify = None
+        self._server = None
+        self._poller = None
+
+    def start(self, supervisor):
+        """Starts watching for updates and accepting commands on the loop of supervisor."""
+        self._supervisor = supervisor
+        supervisor.run_until_complete(self._start())
+
+    def sleep(self, seconds):
+        """Waits, serving the watcher and the commands meanwhile."""
+        self._supervisor.run_until_complete(asyncio.sleep(seconds))
+
+    def call_blocking(self, function, *args):
+        """Calls a blocking function on a thread, serving the watcher and the commands meanwhile.
+
+        Returns:
+            The return value of function.
+        """
+        async def call():
+            return await asyncio.get_event_loop().run_in_executor(None, function, *args)
+        return self._supervisor.run_until_complete(call())
+
+    async def _start(self):
+        self._stop = asyncio.Event()
+
+        os.makedirs(self.data_directory, exist_ok=True)
+        try:
+            self._inotify = Inotify()
+            self._inotify.add_watch(self.data_directory, IN_CLOSE_WRITE | IN_MOVED_TO)
+            asyncio.get_event_loop().add_reader(self._inotify.fileno(), self._on_inotify)
+        except OSError as e:
+            print('Failed to watch {} ({}), polling instead'.format(self.data_directory, e))
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+            self._poller = asyncio.ensure_future(self._poll_updates())
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)  # left behind by a previous run
+        self._server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        print('Listening for commands on {}'.format(self.socket_path))
+
+    def _on_inotify(self):
+        events = self._inotify.read_events()
+        if any(name in UPDATE_FILES for _, _, name in events):
+            self._update_changed()
+
+    async def _poll_updates(self):
+        last = None
+        while True:
+            try:
+                current = [os.stat(os.path.join(self.data_directory, name)).st_mtime_ns for name in UPDATE_FILES]
+            except FileNotFoundError:
+                current = None
+            if current is not None and current != last:
+                self._update_changed()
+            last = current
+            await asyncio.sleep(UPDATE_POLL_INTERVAL)
+
+    def _update_changed(self):
+        if update_package_complete(self.data_directory):
+            self.counters['updates_detected'] += 1
+            print('Update package uploaded')
+            self.install_now()
+
+    def install_now(self):
+        """Starts installing the update package, unless it is incomplete or being installed already.
+
+        Returns:
+            True if an installation is in progress.
+        """
+        if self.installer.running:
+            return True
+        if not update_package_complete(self.data_directory):
+            return False
+
+        self.installer.start()
+        self.counters['installs_started'] += 1
+        return True
+
+    def tracker(self, path):
+        """Creates a Supervisor task that makes the running framework available to the commands.
+
+        Args:
+            path: Directory of the framework version.
+        """
+        async def track(process):
+            self.path = path
+            self.process = process
+            self.counters['framework_starts'] += 1
+            self._stop.clear()
+            try:
+                await self._stop.wait()
+                await process.terminate()
+            finally:
+                self.process = None
+        return track
+
+    def restart(self, skip=False):
+        """Stops the framework, so that the launcher starts the newest, not skipped version.
+
+        Returns:
+            False if the framework is not running.
+        """
+        if self.process is None:
+            return False
+        if skip:
+            print('Skipping {}'.format(self.path))
+            self.skipped_versions.append(self.path)
+        self._stop.set()
+        return True
+
+    def status(self):
+        if self.installer.running:
+            installer = 'running'
+        elif self.installer.finished:
+            installer = 'finished'
+        else:
+            installer = 'idle'
+
+        return {
+            'version': self.path if self.process is not None else None,
+            'pid': self.process.pid if self.process is not None else None,
+            'runtime': self.process.runtime if self.process is not None else None,
+            'installer': installer,
+            'update_pending': update_package_complete(self.data_directory),
+            'skipped_versions': list(self.skipped_versions)
+        }
+
+    def metrics(self):
+        result = dict(self.counters)
+        result['uptime'] = time.monotonic() - self.started
+        if self.process is not None:
+            result['runtime'] = self.process.runtime
+            result['output_lines'] = len(self.process.output)
+            result['since_last_output'] = time.monotonic() - self.process.last_output
+        return result
+
+    def handle_command(self, command):
+        """Executes a control command.
+
+        Returns:
+            The response as a dict.
+        """
+        self.counters['commands'] += 1
+        if command == 'status':
+            return dict(self.status(), ok=True)
+        if command == 'metrics':
+            return dict(self.metrics(), ok=True)
+        if command == 'install-now':
+            return {'ok': self.install_now()}
+        if command == 'restart':
+            return {'ok': self.restart()}
+        if command == 'skip-version':
+            return {'ok': self.restart(skip=True)}
+        return {'ok': False, 'error': 'Unknown command: {}'.format(command)}
+
+    async def _handle_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = self.handle_command(line.decode('utf-8', errors='replace').strip())
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        if self._inotify is not None:
+            asyncio.get_event_loop().remove_reader(self._inotify.fileno())
+            self._inotify.close()
+        if self._poller is not None:
+            self._poller.cancel()
+        if self._server is not None:
+            self._server.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
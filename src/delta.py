@@ -0,0 +1,148 @@
+import json
+import os
+import stat
+
+from package_digest import hash_file, new_hash
+from update_package import CHUNK_SIZE, is_within_directory
+
+
+# file in the extracted delta package that describes how to rebuild the new version
+DELTA_MANIFEST = 'delta.json'
+
+# directory in the extracted delta package that contains the new and patched file contents
+DELTA_FILES_DIR = 'files'
+
+
+class DeltaError(Exception):
+    pass
+
+
+class BaseVersionMissingError(DeltaError):
+    pass
+
+
+def find_base_directory(version_dir, directories):
+    """Looks for a completely installed framework version.
+
+    Args:
+        version_dir: Directory name of the version, see dir_for_version.
+        directories: List of base directories containing installations.
+
+    Returns:
+        Path to the installed version or None if it was not found.
+    """
+    for directory in directories:
+        path = os.path.join(directory, version_dir)
+        if os.path.isfile(os.path.join(path, 'installed')):
+            return path
+
+    return None
+
+
+def _copy_range(src, dst, offset, length, hash_fn):
+    src.seek(offset)
+    while length > 0:
+        chunk = src.read(min(length, CHUNK_SIZE))
+        if not chunk:
+            raise DeltaError('Unexpected end of file')
+        hash_fn.update(chunk)
+        dst.write(chunk)
+        length -= len(chunk)
+
+
+def _copy_all(src, dst, hash_fn):
+    for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+        hash_fn.update(chunk)
+        dst.write(chunk)
+
+
+def _link_base_file(entry, base_path, target_path):
+    """Hard links an unchanged file instead of copying it, if it is intact and has the right mode."""
+    base_stat = os.stat(base_path)
+    if 'mode' in entry and stat.S_IMODE(base_stat.st_mode) != entry['mode']:
+        return False
+
+    if hash_file(base_path, 'md5', cache=False) != entry['md5']:
+        return False
+
+    try:
+        os.link(base_path, target_path)
+    except OSError:
+        # e.g. the filesystem does not support hard links, fall back to copying
+        return False
+
+    return True
+
+
+def _build_file(entry, path, base_dir, patch_dir, target_path):
+    """Writes a single file of the new version and returns its md5 hash."""
+    hash_fn = new_hash('md5')
+    source = entry['source']
+    base_path = os.path.join(base_dir, entry.get('base_path', path))
+    patch_path = os.path.join(patch_dir, path)
+
+    if not is_within_directory(base_dir, base_path):
+        raise DeltaError('Attempted Path Traversal in delta: {}'.format(path))
+
+    if source == 'base' and _link_base_file(entry, base_path, target_path):
+        return entry['md5']
+
+    with open(target_path, 'wb') as dst:
+        if source == 'base':
+            with open(base_path, 'rb') as src:
+                _copy_all(src, dst, hash_fn)
+        elif source == 'patch':
+            with open(patch_path, 'rb') as src:
+                _copy_all(src, dst, hash_fn)
+        elif source == 'blocks':
+            with open(base_path, 'rb') as base, open(patch_path, 'rb') as patch:
+                sources = {'base': base, 'patch': patch}
+                for block_source, offset, length in entry['blocks']:
+                    _copy_range(sources[block_source], dst, offset, length, hash_fn)
+        else:
+            raise DeltaError('Unknown source for {}: {}'.format(path, source))
+
+    return hash_fn.hexdigest()
+
+
+def apply_delta(delta_dir, base_dir, target_dir):
+    """Rebuilds a framework version from an installed base and a delta package.
+
+    The delta manifest lists every file of the new version with its md5 hash
+    and where its contents come from:
+     - 'base': hard linked or copied from the base version (from 'base_path'
+       if renamed)
+     - 'patch': shipped as is in the delta package
+     - 'blocks': assembled from [source, offset, length] ranges of the base
+       file and of the patch data shipped in the delta package
+
+    Every rebuilt file is checked against its hash.
+
+    Args:
+        delta_dir: Directory containing the extracted delta package.
+        base_dir: Directory of the installed base version.
+        target_dir: Directory to build the new version into.
+
+    Raises:
+        DeltaError: The delta could not be applied or the result does not
+            match the manifest.
+        IOError: An error occurred during reading or writing files.
+        KeyError, ValueError: The delta manifest is corrupted.
+    """
+    with open(os.path.join(delta_dir, DELTA_MANIFEST), 'r') as mf:
+        delta_manifest = json.load(mf)
+
+    patch_dir = os.path.join(delta_dir, DELTA_FILES_DIR)
+    os.makedirs(target_dir)
+
+    for path, entry in sorted(delta_manifest['files'].items()):
+        target_path = os.path.join(target_dir, path)
+        if not is_within_directory(target_dir, target_path):
+            raise DeltaError('Attempted Path Traversal in delta: {}'.format(path))
+
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if _build_file(entry, path, base_dir, patch_dir, target_path) != entry['md5']:
+            raise DeltaError('Hash mismatch after applying delta: {}'.format(path))
+
+        if 'mode' in entry and stat.S_IMODE(os.stat(target_path).st_mode) != entry['mode']:
+            os.chmod(target_path, entry['mode'])
@@ -0,0 +1,208 @@
+import os
+import sys
+
+
+# value of 'format' in the metadata of an update package that is a zip archive
+ARCHIVE_FORMAT = 'zip'
+
+# the archive inside the directory of an installed version, run by start_framework
+ARCHIVE_FILE = 'framework.pyz'
+
+# files that can't be imported from the archive are extracted next to it
+NATIVE_SUFFIXES = ('.so', '.pyd')
+
+
+def is_extracted(name):
+    """Checks if a member of the archive is extracted during installation.
+
+    The manifest is read by the launcher, the install directory holds the
+    requirements and wheels of the virtualenv, and native extensions can't
+    be loaded by zipimport.
+
+    >>> is_extracted('install/packages/pyserial-3.4-py2.py3-none-any.whl')
+    True
+    >>> is_extracted('revvy/robot.py')
+    False
+    """
+    return name == 'manifest.json' or name.startswith('install/') or name.endswith(NATIVE_SUFFIXES)
+
+
+def is_native_in_package(name):
+    """Checks if a member of the archive is a native extension inside a package.
+
+    The __path__ of a package imported from the archive only points into the
+    archive, so its extracted native extensions can't be imported. Only top
+    level native extensions are supported, native dependencies belong into
+    the wheels of the virtualenv.
+
+    >>> is_native_in_package('revvy/_native.cpython-37m-arm-linux-gnueabihf.so')
+    True
+    >>> is_native_in_package('_native.so')
+    False
+    >>> is_native_in_package('install/venv/lib/_native.so')
+    False
+    """
+    return '/' in name and not name.startswith('install/') and name.endswith(NATIVE_SUFFIXES)
+
+
+def framework_command(path):
+    """Creates the command that runs a framework version with the interpreter of its virtualenv.
+
+    Versions installed from an archive are run from the archive, with the
+    version directory on the module search path for the extracted native
+    extensions.
+
+    Returns:
+        A tuple of the command and its environment, which is None to inherit
+        the environment of the launcher.
+    """
+    python = os.path.join(path, 'install', 'venv', 'bin', 'python3')
+    archive = os.path.join(path, ARCHIVE_FILE)
+    if not os.path.isfile(archive):
+        return [python, '-u', os.path.join(path, 'revvy.py')], None
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path] + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    return [python, '-u', archive], env
+
+
+def install_archive(package_file, expected_length, expected_digest, destination, algorithm='md5'):
+    """Verifies an archive update package and copies it into destination.
+
+    The package is copied with a single sequential read and write, and is
+    hashed while it is copied, unless its digest is recorded already. Only
+    the members selected by is_extracted are extracted, everything else is
+    imported from the archive when the framework runs. If anything fails,
+    destination is moved to the trash of its parent directory.
+
+    Args:
+        package_file: Path to the zip archive update package.
+        expected_length: Size of the package in bytes, from the metadata.
+        expected_digest: Hex digest of the package, from the metadata.
+        destination: Directory of the new version.
+        algorithm: Hash algorithm of expected_digest.
+
+    Raises:
+        VerificationError: The package does not match the metadata, has no
+            manifest, contains a native extension inside a package, see
+            is_native_in_package, or contains a member that would be
+            extracted outside destination.
+        zipfile.BadZipFile: The package is not a valid archive.
+        IOError: An error occurred during reading the package or writing the
+            files.
+    """
+    import zipfile
+    from package_digest import HASH_CHUNK_SIZE, cached_digest, new_hash, record_digest
+    from trash import move_to_trash, trash_directory
+    from update_package import VerificationError, is_within_directory
+
+    archive = os.path.join(destination, ARCHIVE_FILE)
+    try:
+        os.makedirs(destination)
+        with open(package_file, 'rb', buffering=0) as src, open(archive, 'wb') as dst:
+            st = os.fstat(src.fileno())
+            verified = expected_digest is not None and cached_digest(package_file, algorithm, st) == expected_digest
+            hash_fn = None if verified else new_hash(algorithm)
+            buffer = bytearray(HASH_CHUNK_SIZE)
+            view = memoryview(buffer)
+            length = 0
+            while True:
+                size = src.readinto(buffer)
+                if not size:
+                    break
+                if hash_fn is not None:
+                    hash_fn.update(view[:size])
+                dst.write(view[:size])
+                length += size
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        if length != expected_length:
+            raise VerificationError('Update file length mismatch')
+        if hash_fn is not None:
+            if expected_digest is None or hash_fn.hexdigest() != expected_digest:
+                raise VerificationError('Update file hash mismatch')
+            record_digest(package_file, algorithm, expected_digest, st)
+
+        # only the central directory and the selected members are read
+        with zipfile.ZipFile(archive) as zf:
+            if 'manifest.json' not in zf.namelist():
+                raise VerificationError('Update package has no manifest')
+            native = [name for name in zf.namelist() if is_native_in_package(name)]
+            if native:
+                raise VerificationError('Native extension inside a package: {}'.format(native[0]))
+
+            for info in zf.infolist():
+                if info.filename.endswith('/') or not is_extracted(info.filename):
+                    continue
+                if not is_within_directory(destination, os.path.join(destination, info.filename)):
+                    raise VerificationError('Attempted Path Traversal in Zip File')
+                path = zf.extract(info, destination)
+                mode = (info.external_attr >> 16) & 0o777
+                if mode:
+                    os.chmod(path, mode)
+    except BaseException:
+        move_to_trash(destination, trash_directory(os.path.dirname(destination)))
+        raise
+
+
+def _compiled(source, path):
+    """Compiles a module to the contents of an unchecked hash based pyc file.
+
+    The archive does not change once it is installed, so the pyc files don't
+    need to be validated against their source, and zipimport before python
+    3.8 only loads unchecked ones.
+    """
+    import importlib.util
+    import marshal
+    import struct
+
+    code = compile(source, path, 'exec', dont_inherit=True)
+    return importlib.util.MAGIC_NUMBER + struct.pack('<I', 0b01) + importlib.util.source_hash(source) + \
+        marshal.dumps(code)
+
+
+def compile_archive(archive):
+    """Adds the compiled modules to an archive, next to their sources, where zipimport looks for them.
+
+    Must run with the interpreter that runs the framework, see precompile,
+    and requires python 3.7 for hash based pyc files.
+    The archive is compiled in a copy that replaces it, so that an
+    interruption does not leave a broken archive behind. Modules that are
+    compiled already are skipped.
+
+    Returns:
+        The number of modules that failed to compile.
+    """
+    import shutil
+    import zipfile
+
+    with zipfile.ZipFile(archive) as zf:
+        names = set(zf.namelist())
+    sources = sorted(name for name in names if name.endswith('.py') and name + 'c' not in names)
+    if not sources:
+        return 0
+
+    failed = 0
+    tmp_archive = archive + '.tmp'
+    shutil.copyfile(archive, tmp_archive)
+    with zipfile.ZipFile(tmp_archive, 'a') as zf:
+        for name in sources:
+            source = zf.read(name)
+            try:
+                data = _compiled(source, os.path.join(archive, name))
+            except (SyntaxError, ValueError) as e:
+                print('Failed to compile {}: {}'.format(name, e))
+                failed += 1
+                continue
+            zf.writestr(name + 'c', data, zipfile.ZIP_STORED)
+
+    with open(tmp_archive, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_archive, archive)
+    return failed
+
+
+if __name__ == '__main__':
+    # run by precompile with the interpreter of the virtualenv
+    sys.exit(1 if compile_archive(sys.argv[1]) else 0)
@@ -0,0 +1,191 @@
+import glob
+import os
+import select
+import time
+
+
+# GPIO pins are identified by their BCM number
+SYSFS_GPIO_DIR = '/sys/class/gpio'
+
+
+class GpioError(Exception):
+    pass
+
+
+class GpioBackend:
+    """Interface to read digital inputs."""
+
+    def configure_input(self, pin):
+        raise NotImplementedError
+
+    def read(self, pin):
+        """Returns True if the pin is high."""
+        raise NotImplementedError
+
+    def wait_for_high(self, pin, timeout=None):
+        """Blocks until the pin is high.
+
+        Args:
+            pin: BCM pin number, must be configured as input.
+            timeout: Maximum time to wait in seconds, None to wait forever.
+
+        Returns:
+            True if the pin is high, False on timeout.
+        """
+        raise NotImplementedError
+
+
+class SysfsGpio(GpioBackend):
+    """Edge triggered GPIO access through the sysfs interface.
+
+    Waiting blocks in poll() on the value file, so no CPU time is used until
+    the pin changes.
+    """
+
+    def __init__(self, sysfs_dir=SYSFS_GPIO_DIR):
+        self._sysfs_dir = sysfs_dir
+        self._base = self._find_base()
+        self._value_files = {}
+
+    def _find_base(self):
+        """Returns the number of the first pin of the SoC's GPIO controller.
+
+        Newer kernels don't start numbering at 0, so BCM numbers need an offset.
+        """
+        bases = []
+        for chip in glob.glob(os.path.join(self._sysfs_dir, 'gpiochip*')):
+            try:
+                with open(os.path.join(chip, 'label'), 'r') as f:
+                    label = f.read().strip()
+                with open(os.path.join(chip, 'base'), 'r') as f:
+                    base = int(f.read())
+            except (IOError, ValueError):
+                continue
+            bases.append((not label.startswith('pinctrl-'), base))
+
+        return min(bases)[1] if bases else 0
+
+    def _pin_dir(self, pin):
+        return os.path.join(self._sysfs_dir, 'gpio{}'.format(self._base + pin))
+
+    def _write(self, path, value):
+        with open(path, 'w') as f:
+            f.write(value)
+
+    def configure_input(self, pin):
+        pin_dir = self._pin_dir(pin)
+        try:
+            if not os.path.isdir(pin_dir):
+                self._write(os.path.join(self._sysfs_dir, 'export'), str(self._base + pin))
+                # udev may need some time to set permissions on the new files
+                for _ in range(20):
+                    if os.access(os.path.join(pin_dir, 'direction'), os.W_OK):
+                        break
+                    time.sleep(0.01)
+            self._write(os.path.join(pin_dir, 'direction'), 'in')
+            self._write(os.path.join(pin_dir, 'edge'), 'both')
+        except IOError as e:
+            raise GpioError('Failed to configure pin {}: {}'.format(pin, e))
+
+    def _value_file(self, pin):
+        if pin not in self._value_files:
+            self._value_files[pin] = open(os.path.join(self._pin_dir(pin), 'value'), 'r')
+        return self._value_files[pin]
+
+    def read(self, pin):
+        value_file = self._value_file(pin)
+        value_file.seek(0)
+        return value_file.read().strip() == '1'
+
+    def wait_for_high(self, pin, timeout=None):
+        value_file = self._value_file(pin)
+        poller = select.poll()
+        poller.register(value_file, select.POLLPRI | select.POLLERR)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # reading the value acknowledges pending edges, so check after every read
+        while not self.read(pin):
+            if deadline is None:
+                poller.poll()
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                poller.poll(remaining * 1000)
+
+        return True
+
+
+class CommandGpio(GpioBackend):
+    """GPIO access through the wiringPi 'gpio' utility.
+
+    Only used if the sysfs interface is not available, waiting polls the pin.
+    """
+
+    def __init__(self, poll_interval=1.0):
+        self._poll_interval = poll_interval
+
+    def configure_input(self, pin):
+        import subprocess
+        if subprocess.call(['gpio', '-g', 'mode', str(pin), 'in']) != 0:
+            raise GpioError('Failed to configure pin {}'.format(pin))
+
+    def read(self, pin):
+        import subprocess
+        return subprocess.check_output(['gpio', '-g', 'read', str(pin)]) == b'1\n'
+
+    def wait_for_high(self, pin, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.read(pin):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self._poll_interval)
+
+        return True
+
+
+class FileGpio(GpioBackend):
+    """Fake GPIO backend for testing without hardware.
+
+    The value of each pin is read from the file 'gpio<pin>' in a directory,
+    containing '1' or '0'. A missing file reads as low.
+    """
+
+    def __init__(self, directory, poll_interval=0.05):
+        self._directory = directory
+        self._poll_interval = poll_interval
+
+    def configure_input(self, pin):
+        pass
+
+    def read(self, pin):
+        try:
+            with open(os.path.join(self._directory, 'gpio{}'.format(pin)), 'r') as f:
+                return f.read().strip() == '1'
+        except FileNotFoundError:
+            return False
+
+    def wait_for_high(self, pin, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.read(pin):
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(self._poll_interval)
+
+        return True
+
+
+def create_gpio_backend(fake_directory=None):
+    """Returns the best available GPIO backend.
+
+    Args:
+        fake_directory: If set, pins are read from files in this directory,
+            see FileGpio.
+    """
+    if fake_directory is not None:
+        return FileGpio(fake_directory)
+
+    if os.path.isdir(SYSFS_GPIO_DIR):
+        return SysfsGpio()
+
+    return CommandGpio()
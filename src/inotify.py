@@ -0,0 +1,72 @@
+import ctypes
+import ctypes.util
+import os
+import struct
+
+
+# event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_EVENT_HEADER = struct.Struct('iIII')
+_READ_SIZE = 64 * 1024
+
+
+class Inotify:
+    """Minimal wrapper of the Linux inotify API.
+
+    The file descriptor is non-blocking, so it can be watched by an event loop.
+
+    Raises:
+        OSError: inotify is not available.
+    """
+
+    def __init__(self):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            self._add_watch = libc.inotify_add_watch
+            self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        except AttributeError:
+            raise OSError('inotify is not supported')
+
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._fd = fd
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        wd = self._add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def read_events(self):
+        """Returns the pending events as a list of (watch descriptor, mask, name) tuples."""
+        try:
+            data = os.read(self._fd, _READ_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -0,0 +1,111 @@
+import json
+import os
+
+
+# written into the directory of an installation that has not finished yet
+JOURNAL_FILE = 'install-journal.json'
+
+# installation steps, in the order they complete
+EXTRACTED = 'extracted'
+VERIFIED = 'verified'
+VENV_CREATED = 'venv_created'
+DEPENDENCIES_INSTALLED = 'dependencies_installed'
+COMPILED = 'compiled'
+STEPS = (EXTRACTED, VERIFIED, VENV_CREATED, DEPENDENCIES_INSTALLED, COMPILED)
+
+
+class InstallJournal:
+    """Checkpoints of an installation in progress.
+
+    Every completed step is saved to the installation directory right away,
+    so an installation that is interrupted, e.g. by a power loss, can be
+    resumed from the last completed step instead of being started over.
+
+    Attributes:
+        directory: Directory of the installation. The journal moves with it.
+        package: md5 hash of the update package being installed.
+        steps: Completed steps, in order.
+        details: Step specific information needed to resume.
+    """
+
+    def __init__(self, directory, package, steps=(), details=None):
+        self.directory = directory
+        self.package = package
+        self.steps = list(steps)
+        self.details = dict(details or {})
+
+    @classmethod
+    def load(cls, directory):
+        """Reads the journal of an installation directory.
+
+        Returns:
+            The InstallJournal, or None if there is no valid journal.
+        """
+        try:
+            with open(os.path.join(directory, JOURNAL_FILE), 'r') as f:
+                data = json.load(f)
+            if any(step not in STEPS for step in data['steps']):
+                return None
+            return cls(directory, data['package'], data['steps'], data.get('details'))
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    def done(self, step):
+        return step in self.steps
+
+    def complete(self, step, **details):
+        """Records a completed step and saves the journal."""
+        if step not in self.steps:
+            self.steps.append(step)
+        self.update(**details)
+
+    def update(self, **details):
+        """Records details of the installation, e.g. failed attempts, and saves the journal."""
+        self.details.update(details)
+        self._save()
+
+    def rollback(self, step):
+        """Forgets step and all steps after it, e.g. because its result is missing."""
+        if step in self.steps:
+            del self.steps[self.steps.index(step):]
+            self._save()
+
+    def remove(self):
+        try:
+            os.unlink(os.path.join(self.directory, JOURNAL_FILE))
+        except FileNotFoundError:
+            pass
+
+    def _save(self):
+        journal_file = os.path.join(self.directory, JOURNAL_FILE)
+        with open(journal_file + '.tmp', 'w') as f:
+            json.dump({'package': self.package, 'steps': self.steps, 'details': self.details}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(journal_file + '.tmp', journal_file)
+
+
+def find_journal(install_directory, package):
+    """Looks for an unfinished installation of an update package.
+
+    Args:
+        install_directory: Directory path with the fw installations.
+        package: md5 hash of the update package.
+
+    Returns:
+        The InstallJournal of the installation, or None.
+    """
+    try:
+        names = sorted(os.listdir(install_directory))
+    except FileNotFoundError:
+        return None
+
+    for name in names:
+        fw_dir = os.path.join(install_directory, name)
+        if os.path.isfile(os.path.join(fw_dir, 'installed')):
+            continue
+        journal = InstallJournal.load(fw_dir)
+        if journal is not None and journal.package == package:
+            return journal
+
+    return None
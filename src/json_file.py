@@ -0,0 +1,64 @@
+import json
+import os
+
+
+def load_json(file):
+    """Reads a json file written by save_json.
+
+    Returns:
+        The contents, or an empty dict if the file is missing or invalid.
+    """
+    try:
+        with open(file, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_json(file, data, name):
+    """Replaces a json file, so that an interrupted write leaves the previous contents in place.
+
+    Failures are printed, not raised, the launcher keeps running with the
+    state it has in memory.
+
+    Args:
+        file: Path of the json file.
+        data: The contents.
+        name: What the file contains, for the error message.
+    """
+    try:
+        with open(file + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.replace(file + '.tmp', file)
+    except IOError:
+        print('Failed to save {}'.format(name))
+
+
+def read_manifest_section(manifest_file, section, defaults, name):
+    """Reads an optional settings object of a framework manifest.
+
+    Values missing from the object are taken from defaults, the others are
+    converted to the type of their default.
+
+    Args:
+        manifest_file: Path to a json formatted manifest file.
+        section: Key of the settings object in the manifest.
+        defaults: The default settings, a dict.
+        name: What the settings are, for the error message.
+
+    Returns:
+        The settings as a new dict, the defaults if the manifest can't be
+        read or the settings are invalid.
+    """
+    settings = dict(defaults)
+    try:
+        with open(manifest_file, 'r') as mf:
+            overrides = json.load(mf).get(section, {})
+        for key in defaults:
+            if key in overrides:
+                settings[key] = type(defaults[key])(overrides[key])
+    except (IOError, ValueError, TypeError, AttributeError):
+        print('Invalid {} in {}, using default'.format(name, manifest_file))
+        return dict(defaults)
+
+    return settings
@@ -1,22 +1,40 @@
 #!/bin/python3
-import argparse
 import json
 import os
-import shutil
-import subprocess
 import sys
-import tarfile
-import hashlib
 import time
-import traceback
 from json import JSONDecodeError
-from version import Version
-
+from boot_trace import add_bytes, begin_boot, end_boot, mark, span, traced
+from framework_archive import ARCHIVE_FILE, framework_command
+from gpio import CommandGpio, GpioError, create_gpio_backend
+from install_journal import COMPILED, DEPENDENCIES_INSTALLED, EXTRACTED, VENV_CREATED, VERIFIED, InstallJournal, \
+    find_journal
+from package_digest import package_digest, remove_cache
+from readiness import read_readiness_config, wait_until_ready
+from retention import DEFAULT_KEEP_VERSIONS, LaunchHistory, disk_usage, exclusive_size, launch_recorder, \
+    select_evictions
+from restart_policy import RestartHistory, backoff_delay, budget_exhausted, budget_wait, read_restart_policy
+from trash import TrashReclaimer, move_to_trash, trash_directory
+from version import FormatError, Version
+from version_index import entry_is_current, load_index, newest_entry, update_index
+
+# Modules that are only needed to install updates, to run the framework, or in
+# some modes, are imported where they are used, so that they are only loaded
+# when needed. See tools/import_budget.py.
 
 default_package_dir = 'default/packages'
 installed_packages_dir = 'user/packages'
 start_directories = [installed_packages_dir, default_package_dir]
 
+_supervisor = None
+_reclaimers = {}
+
+# BCM pin number of AMP_EN, high when Revvy is ON
+AMP_EN_PIN = 22
+
+# an update package is removed after its virtualenv failed to set up this many times
+MAX_SETUP_ATTEMPTS = 3
+
 
 def read_version(file):
     """Reads version from json formatted manifest file.
@@ -42,79 +60,188 @@ def read_version(file):
     return None
 
 
-def file_hash(file):
-    """Calculates the md5 hash for the file provided.
+def print_traceback():
+    """Prints the exception being handled."""
+    import traceback
+    print(traceback.format_exc())
 
-    Args:
-        file: Path to the file.
 
-    Returns:
-        The md5 hash string of the file or None on error.
-        E.g.: 'd41d8cd98f00b204e9800998ecf8427e'
+def get_supervisor():
+    """Returns the Supervisor that runs the child processes of the launcher."""
+    global _supervisor
+    if _supervisor is None:
+        from supervisor import Supervisor
+        _supervisor = Supervisor()
+    return _supervisor
 
-    Raises:
-        IOError: An error occurred during opening/reading the file.
-    """
-    try:
-        hash_fn = hashlib.md5()
-        with open(file, "rb") as f:
-            hash_fn.update(f.read())
-        return hash_fn.hexdigest()
-    except IOError:
-        print('Could not calculate hash for {}'.format(file))
-        print(traceback.format_exc())
-        return None
 
-
-def subprocess_cmd(command):
-    """Executes shell commands
+def run_commands(commands):
+    """Executes commands one after another, without a shell.
 
     Args:
-        command: Newline separated commands to be executed in the shell
+        commands: List of commands, each one a list of the program and its
+            arguments.
 
     Returns:
-        Return code of execution
+        Return code of the first failing command, or 0 if all succeeded.
     """
-    try:
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True, universal_newlines=True)
-        for line in iter(process.stdout.readline, b''):
-            sys.stdout.write(line)
-            if process.poll() is not None:
-                break
-        return process.returncode
-    except BrokenPipeError:
-        return 0
+    supervisor = get_supervisor()
+    for command in commands:
+        try:
+            with span(' '.join([os.path.basename(command[0])] + command[1:3])):
+                result = supervisor.run(command)
+        except OSError:
+            print('Failed to execute {}'.format(command[0]))
+            print_traceback()
+            return 127
+
+        if result.returncode != 0:
+            print('{} exited with {}'.format(command[0], result.returncode))
+            return result.returncode
+
+    return 0
 
 
-def cleanup_invalid_installations(directory):
+@traced('cleanup')
+def cleanup_invalid_installations(directory, pending_package=None):
     """Removes incomplete versions of fw installations.
 
     The presence of the 'installed' file proves that the installation
     completed successfully. For any fw directory without this sentinel,
-    we remove the directory.
+    we remove the directory, unless it is an interrupted installation of the
+    pending update package, which can be resumed. Directories are moved to
+    the trash, which is emptied by reclaim_trash.
 
     Args:
         directory: Base directory, containing installations.
+        pending_package: Digest of the update package waiting to be
+            installed, or None.
     """
     print("Cleaning up invalid installations")
     try:
+        removed = False
         for fw_dir in os.listdir(directory):
+            if fw_dir.startswith('.'):
+                # the object store and the trash
+                continue
             print("Checking {}".format(fw_dir))
             fw_dir = os.path.join(directory, fw_dir)
             if os.path.isdir(fw_dir):
                 manifest_file = os.path.join(fw_dir, 'installed')
                 if not os.path.isfile(manifest_file):
+                    journal = InstallJournal.load(fw_dir)
+                    if pending_package is not None and journal is not None and journal.package == pending_package:
+                        print('Keeping interrupted installation {}'.format(fw_dir))
+                        continue
                     print('Removing {}'.format(fw_dir))
-                    shutil.rmtree(fw_dir)
+                    move_to_trash(fw_dir, trash_directory(directory))
+                    removed = True
+
+        if removed:
+            update_index(directory, read_version)
     except FileNotFoundError:
         print('No user packages exist')
 
 
+@traced('retention')
+def enforce_retention(directory, launches, keep=DEFAULT_KEEP_VERSIONS, quota=None):
+    """Removes installed versions that are no longer needed.
+
+    The newest known good versions and the last version that ran successfully
+    are kept, see retention.select_evictions. If a quota is given, versions
+    are removed, least recently launched first, until the installations fit
+    into it. The default packages are never removed.
+
+    Args:
+        directory: Base directory, containing installations.
+        launches: LaunchHistory of the installed versions.
+        keep: Number of known good versions to keep.
+        quota: Space the installations may use in bytes, or None.
+    """
+    if os.path.abspath(directory) == os.path.abspath(default_package_dir):
+        return
+
+    try:
+        index = load_index(directory) or update_index(directory, read_version)
+        versions = [os.path.join(directory, entry['path']) for entry in index['entries'] if entry['installed']]
+
+        evicted = select_evictions(versions, launches, keep)
+        if quota is not None:
+            usage = disk_usage(directory)
+            if usage > quota:
+                sizes = {path: exclusive_size(path) for path in versions}
+                evicted = select_evictions(versions, launches, keep, quota, usage, sizes)
+    except FileNotFoundError:
+        return
+
+    for path in evicted:
+        print('Removing old version {}'.format(path))
+        move_to_trash(path, trash_directory(directory))
+        launches.forget(path)
+
+    if evicted:
+        update_index(directory, read_version)
+
+
+def pending_package_hash(directory):
+    """Returns the digest of the update package in directory, or None if there is none."""
+    try:
+        with open(os.path.join(directory, '2.meta'), 'r') as fup_mf:
+            return package_digest(json.load(fup_mf))[1]
+    except (IOError, JSONDecodeError, KeyError, AttributeError):
+        return None
+
+
+def reclaim_trash(directory, reclaimer_class=TrashReclaimer):
+    """Starts emptying the trash of an installation directory in the background.
+
+    Unused objects of the object store are removed once the trash is empty.
+    Deletions interrupted by a shutdown continue the next time this is called.
+
+    Args:
+        directory: Base directory, containing installations.
+        reclaimer_class: Creates the reclaimer of the directory, the first
+            time it is called with the directory.
+    """
+    reclaimer = _reclaimers.get(directory)
+    if reclaimer is None:
+        reclaimer = reclaimer_class(directory)
+        _reclaimers[directory] = reclaimer
+
+    reclaimer.start()
+
+
+@traced('dedupe')
+def deduplicate_installation(install_directory, target_dir):
+    """Replaces the files of an installed version by links into the object store.
+
+    Deduplication is only an optimization, the installation is usable even
+    if it fails.
+
+    Args:
+        install_directory: Directory path with the fw installations.
+        target_dir: Directory of the installed version.
+    """
+    from object_store import add_tree, store_directory
+
+    print('Deduplicating {}'.format(target_dir))
+    try:
+        freed = add_tree(target_dir, store_directory(install_directory))
+        add_bytes(freed)
+        print('Deduplication saved {} bytes'.format(freed))
+    except OSError:
+        print('Failed to deduplicate {}'.format(target_dir))
+        print_traceback()
+
+
+@traced('update_check')
 def has_update_package(directory):
     """Checks if a valid fw update package is available.
 
-    The '2.meta' json file contains length and md5 information about the update
-    package named '2.data'. The code checks if these values are matching.
+    The '2.meta' json file contains the length and digest of the update
+    package named '2.data', see package_digest. Only the length is checked
+    here, the digest is verified by install_update_package while the package
+    is being extracted, so that the package only needs to be read once.
 
     Args:
         directory: (String) Directory path containing update package.
@@ -132,25 +259,30 @@ def has_update_package(directory):
         try:
             with open(framework_update_meta_file, 'r') as fup_mf:
                 metadata = json.load(fup_mf)
-                if metadata['length'] == os.stat(framework_update_file).st_size:
-                    if metadata['md5'] is not None and file_hash(framework_update_file) == metadata['md5']:
-                        update_file_valid = True
-                    else:
-                        print('Update file hash mismatch')
+                if package_digest(metadata)[1] is None:
+                    print('Update file hash missing')
+                elif metadata['length'] == os.stat(framework_update_file).st_size:
+                    update_file_valid = True
                 else:
                     print('Update file length mismatch')
         except IOError:
             print("Failed to read metadata")
-        except (JSONDecodeError, KeyError):
+        except (JSONDecodeError, KeyError, AttributeError):
             print("Update metadata corrupted, skipping update")
 
         if not update_file_valid:
-            os.unlink(framework_update_file)
-            os.unlink(framework_update_meta_file)
+            remove_update_package(directory)
 
     return update_file_valid
 
 
+def remove_update_package(directory):
+    """Deletes the update package in directory, along with its recorded digests."""
+    os.unlink(os.path.join(directory, '2.data'))
+    os.unlink(os.path.join(directory, '2.meta'))
+    remove_cache(os.path.join(directory, '2.data'))
+
+
 def dir_for_version(version):
     """Generates directory name for a framework version.
 
@@ -163,205 +295,660 @@ def dir_for_version(version):
     return 'revvy-{}'.format(version)
 
 
-def install_update_package(data_directory, install_directory):
+@traced('delta')
+def rebuild_from_delta(delta_dir, base_version, base_directories, target_dir):
+    """Rebuilds a framework version from a delta update package.
+
+    Args:
+        delta_dir: Directory containing the extracted delta package.
+        base_version: Version string of the framework the delta was made against.
+        base_directories: List of directories to look for the base version in.
+        target_dir: Directory to build the new version into.
+
+    Raises:
+        BaseVersionMissingError: The base version is not installed.
+        DeltaError: The delta could not be applied.
+    """
+    from delta import BaseVersionMissingError, apply_delta, find_base_directory
+
+    base_dir = find_base_directory(dir_for_version(Version(base_version)), base_directories)
+    if base_dir is None:
+        raise BaseVersionMissingError('Base version {} is not installed'.format(base_version))
+
+    print('Applying delta to {}'.format(base_dir))
+    try:
+        apply_delta(delta_dir, base_dir, target_dir)
+    except BaseException:
+        move_to_trash(target_dir, trash_directory(os.path.dirname(target_dir)))
+        raise
+
+
+@traced('venv')
+def setup_venv(install_directory, target_dir, journal):
+    """Creates the virtualenv of a framework version and installs its dependencies.
+
+    The requirements and wheels are fingerprinted. If an installed version
+    has a virtualenv with the same fingerprint, it is cloned instead of being
+    rebuilt. If one only differs in some wheels, it is cloned, the
+    distributions its requirements pin but the new ones don't are removed, and
+    only the changed wheels are installed. Otherwise a new virtualenv is
+    created.
+    The fingerprint is recorded in the virtualenv if setup succeeded, so that
+    broken virtualenvs are never reused.
+    Creating the virtualenv and installing the dependencies are recorded in
+    the journal. If the virtualenv was already created by an interrupted
+    installation, only the dependencies are installed.
+
+    Args:
+        install_directory: Directory path with the fw installations.
+        target_dir: Directory of the version being installed.
+        journal: InstallJournal of the installation.
+
+    Returns:
+        True if the virtualenv is set up and the dependencies are installed.
+    """
+    import shutil
+    from venv_reuse import changed_wheels, clone_venv, find_reusable_venv, venv_fingerprint, write_fingerprint
+    from wheel_install import UnsupportedWheel, uninstall_dropped
+
+    install_dir = os.path.join(target_dir, 'install')
+    venv_dir = os.path.join(install_dir, 'venv')
+
+    try:
+        fingerprint = venv_fingerprint(install_dir)
+        source_venv, source_fingerprint = find_reusable_venv(install_directory, fingerprint, target_dir)
+    except IOError:
+        print('Failed to fingerprint dependencies')
+        print_traceback()
+        fingerprint, source_venv = None, None
+
+    if not journal.done(VENV_CREATED):
+        # left behind by an interrupted setup
+        move_to_trash(venv_dir, trash_directory(install_directory))
+
+        if source_venv is not None:
+            print('Cloning venv from {}'.format(source_venv))
+            try:
+                clone_venv(source_venv, venv_dir)
+                if source_fingerprint != fingerprint:
+                    uninstall_dropped(os.path.join(os.path.dirname(source_venv), 'requirements.txt'),
+                                      os.path.join(install_dir, 'requirements.txt'), venv_dir)
+            except (IOError, shutil.Error, UnsupportedWheel):
+                print('Failed to clone venv')
+                print_traceback()
+                move_to_trash(venv_dir, trash_directory(install_directory))
+                source_venv = None
+
+        if source_venv is None:
+            print('Running setup')
+            print('Setting up venv')
+            if run_commands([['python3', '-m', 'venv', venv_dir]]) != 0:
+                return False
+            # None: install every requirement
+            journal.complete(VENV_CREATED, changed_wheels=None)
+        elif source_fingerprint != fingerprint:
+            journal.complete(VENV_CREATED, changed_wheels=changed_wheels(source_fingerprint, fingerprint))
+        else:
+            print('Dependencies are unchanged')
+            journal.complete(VENV_CREATED, changed_wheels=[])
+            journal.complete(DEPENDENCIES_INSTALLED)
+    else:
+        print('Resuming setup of {}'.format(venv_dir))
+
+    if not journal.done(DEPENDENCIES_INSTALLED):
+        wheels = journal.details.get('changed_wheels')
+        if wheels:
+            print('Installing changed dependencies: {}'.format(', '.join(wheels)))
+        if install_dependencies(install_dir, venv_dir, wheels) == 0:
+            journal.complete(DEPENDENCIES_INSTALLED)
+
+    if not journal.done(DEPENDENCIES_INSTALLED):
+        return False
+
+    if fingerprint is not None and os.path.isdir(venv_dir):
+        write_fingerprint(venv_dir, fingerprint)
+    return True
+
+
+@traced('dependencies')
+def install_dependencies(install_dir, venv_dir, changed_wheels=None):
+    """Installs the requirements of a framework version into its virtualenv.
+
+    Pinned requirements are installed from the bundled wheels by the
+    launcher itself, see wheel_install, which is much faster than starting
+    pip. pip is only run for what that can't handle, e.g. source packages,
+    unpinned requirements or a virtualenv of another python version.
+
+    Args:
+        install_dir: The 'install' directory of the framework version.
+        venv_dir: The virtualenv of the framework version.
+        changed_wheels: File names of wheels that need to be reinstalled even
+            if their version is installed, or None.
+
+    Returns:
+        Return code of the first failing pip command, or 0 on success.
+    """
+    from wheel_install import UnsupportedWheel, install_wheels
+
+    venv_python = os.path.join(venv_dir, 'bin', 'python3')
+    packages_dir = os.path.join(install_dir, 'packages')
+    requirements_file = os.path.join(install_dir, 'requirements.txt')
+    try:
+        requirements, wheels = install_wheels(requirements_file, packages_dir, venv_dir, changed_wheels or ())
+    except UnsupportedWheel as e:
+        print('Installing dependencies with pip: {}'.format(e))
+        requirements, wheels = ['-r', requirements_file], changed_wheels or []
+    except IOError:
+        print('Failed to install dependencies')
+        print_traceback()
+        return 1
+
+    commands = []
+    if wheels:
+        # reinstall rebuilt wheels that keep their version
+        commands.append([venv_python, '-m', 'pip', 'install', '--no-cache-dir', '--no-index', '--no-deps',
+                         '--force-reinstall'] + [os.path.join(packages_dir, w) for w in wheels])
+    if requirements:
+        # already satisfied requirements are skipped
+        commands.append([venv_python, '-m', 'pip', 'install', '--no-cache-dir', '--no-index',
+                         '--find-links', 'file:///{}'.format(packages_dir)] + requirements)
+    return run_commands(commands)
+
+
+@traced('compile')
+def precompile(target_dir):
+    """Compiles the python files of an installed version and its virtualenv.
+
+    The compilation runs on all cores with the interpreter of the virtualenv.
+    From python 3.7, the pyc files are validated by the hash of their source
+    instead of its modification time, so they stay valid regardless of file
+    timestamps, and the first start of the new version does not have to
+    compile anything. The modules of a framework archive are compiled into
+    the archive, which also requires python 3.7.
+    Failures are reported, but do not fail the installation.
+
+    Args:
+        target_dir: Directory of the installed version.
+    """
+    print('Compiling {}'.format(target_dir))
+    venv_python = os.path.join(target_dir, 'install', 'venv', 'bin', 'python3')
+    # the virtualenv is created with the python version of the launcher
+    hash_based = sys.version_info >= (3, 7)
+    if hash_based:
+        commands = [
+            [venv_python, '-m', 'compileall', '-q', '-j', '0', '--invalidation-mode', 'checked-hash', target_dir]
+        ]
+    else:
+        commands = [[venv_python, '-m', 'compileall', '-q', '-j', '0', target_dir]]
+    archive = os.path.join(target_dir, ARCHIVE_FILE)
+    if hash_based and os.path.isfile(archive):
+        commands.append([venv_python, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'framework_archive.py'),
+                         archive])
+    return_value = run_commands(commands)
+    if return_value != 0:
+        print('Failed to compile some files of {}'.format(target_dir))
+
+
+def resume_installation(journal):
+    """Checks the results of the completed steps of an interrupted installation.
+
+    Steps whose results are missing are rolled back, so they are done again.
+
+    Args:
+        journal: InstallJournal of the interrupted installation.
+
+    Returns:
+        The journal, or None if the installation has to be started over.
+    """
+    print('Resuming installation in {}, completed steps: {}'.format(journal.directory, ', '.join(journal.steps)))
+    if not journal.done(VERIFIED) or read_version(os.path.join(journal.directory, 'manifest.json')) is None:
+        print('Extracted files are incomplete, starting over')
+        move_to_trash(journal.directory, trash_directory(os.path.dirname(journal.directory)))
+        return None
+
+    if not os.path.isfile(os.path.join(journal.directory, 'install', 'venv', 'bin', 'python3')):
+        journal.rollback(VENV_CREATED)
+
+    return journal
+
+
+def extract_update_package(framework_update_file, metadata, install_directory, base_directories):
+    """Verifies and extracts an update package into the 'tmp' dir of the installation directory.
+
+    Packages with the 'zip' format are archives the framework runs from, they
+    are copied as a whole and only partially extracted, see framework_archive.
+
+    Args:
+        framework_update_file: Path of the update package.
+        metadata: Contents of the '2.meta' file of the package.
+        install_directory: Directory path with the fw installations.
+        base_directories: List of directories to look for the base version of
+            a delta package in.
+
+    Returns:
+        The InstallJournal of the new installation, or None if the package is
+        invalid.
+    """
+    import tarfile
+    import zipfile
+    from delta import BaseVersionMissingError, DeltaError
+    from framework_archive import ARCHIVE_FORMAT, install_archive
+    from update_package import VerificationError, extract_verified
+
+    tmp_dir = os.path.join(install_directory, 'tmp')
+    delta_dir = os.path.join(install_directory, 'delta')
+
+    for stuck_dir in (tmp_dir, delta_dir):
+        if os.path.isdir(stuck_dir):
+            print('Removing stuck tmp dir: {}'.format(stuck_dir))
+            move_to_trash(stuck_dir, trash_directory(install_directory))  # probably failed update?
+
+    # try to verify and extract package
+    try:
+        base_version = metadata.get('base')
+        is_archive = metadata.get('format') == ARCHIVE_FORMAT
+        if is_archive and base_version is not None:
+            print('Archive packages can not be delta packages')
+            return None
+
+        extract_dir = tmp_dir if base_version is None else delta_dir
+        print('Extracting update package to: {}'.format(extract_dir))
+        with span('extract') as extract_span:
+            extract_span.bytes = metadata['length']
+            algorithm, digest = package_digest(metadata)
+            if is_archive:
+                install_archive(framework_update_file, metadata['length'], digest, extract_dir, algorithm=algorithm)
+            else:
+                extract_verified(framework_update_file, metadata['length'], digest, extract_dir, algorithm=algorithm)
+    except VerificationError as e:
+        print('Failed to verify package: {}'.format(e))
+        return None
+    except (IOError, KeyError, ValueError, tarfile.TarError, zipfile.BadZipFile):
+        print('Failed to extract package')
+        print_traceback()
+        return None
+
+    if base_version is not None:
+        try:
+            rebuild_from_delta(delta_dir, base_version, base_directories, tmp_dir)
+        except BaseVersionMissingError as e:
+            print('{}, a full update package is required'.format(e))
+        except (DeltaError, IOError, KeyError, ValueError, FormatError):
+            print('Failed to apply delta package')
+            print_traceback()
+        finally:
+            move_to_trash(delta_dir, trash_directory(install_directory))
+
+        if not os.path.isdir(tmp_dir):
+            return None
+
+    # the package is verified while it is extracted, the files must be on disk before the journal says so
+    os.sync()
+    journal = InstallJournal(tmp_dir, digest, [EXTRACTED])
+    journal.complete(VERIFIED)
+    return journal
+
+
+@traced('install')
+def install_update_package(data_directory, install_directory, base_directories=None):
     """Install update package.
 
-    Extracts, validates and installs the update package. If any step of this
-    process fails tries to clean up, and remove the corrupt update package.
-    Installation creates a virtualenv, installs required packages via pip from
-    a local repository, and places the 'installed' placeholder into the
-    directory, as the final step, to prove that installation finished
-    successfully.
+    Verifies and extracts the update package in a single pass, then installs
+    it. If any step of this process fails tries to clean up, and remove the
+    corrupt update package.
+    If the metadata names a 'base' version, the package is a delta and the new
+    version is rebuilt from the installed base version. A delta is rejected
+    if the base version is not installed, so a full package can be sent.
+    Installation creates or reuses a virtualenv, installs required packages via
+    pip from a local repository, precompiles the python files, deduplicates
+    the files against the other installed versions through the object store,
+    and places the 'installed' placeholder into the directory, as the final
+    step, to prove that installation finished successfully. The version index
+    of the installation directory is updated afterwards.
+    Completed steps are recorded in a journal in the directory of the version.
+    An installation of the same package that was interrupted, or whose
+    virtualenv could not be set up, is resumed from its last completed step
+    instead of being started over. After MAX_SETUP_ATTEMPTS failures to set up
+    the virtualenv, the installation and the update package are removed.
 
     Args:
         data_directory: Directory path containing the fw update.
         install_directory: Directory path with the fw installations.
+        base_directories: List of directories to look for the base version of
+            a delta package in. Defaults to install_directory and the default
+            package directory.
     """
     framework_update_file = os.path.join(data_directory, '2.data')
     framework_update_meta_file = os.path.join(data_directory, '2.meta')
     tmp_dir = os.path.join(install_directory, 'tmp')
 
-    if os.path.isdir(tmp_dir):
-        print('Removing stuck tmp dir: {}'.format(tmp_dir))
-        shutil.rmtree(tmp_dir)  # probably failed update?
+    if base_directories is None:
+        base_directories = [install_directory, default_package_dir]
 
-    # try to extract package
     try:
-        print('Extracting update package to: {}'.format(tmp_dir))
-        with tarfile.open(framework_update_file, "r:gz") as tar:
-            def is_within_directory(directory, target):
-                
-                abs_directory = os.path.abspath(directory)
-                abs_target = os.path.abspath(target)
-            
-                prefix = os.path.commonprefix([abs_directory, abs_target])
-                
-                return prefix == abs_directory
-            
-            def safe_extract(tar, path=".", members=None, *, numeric_owner=False):
-            
-                for member in tar.getmembers():
-                    member_path = os.path.join(path, member.name)
-                    if not is_within_directory(path, member_path):
-                        raise Exception("Attempted Path Traversal in Tar File")
-            
-                tar.extractall(path, members, numeric_owner=numeric_owner) 
-                
-            
-            safe_extract(tar, path=tmp_dir)
-    except (ValueError, tarfile.TarError):
-        print('Failed to extract package')
-        os.unlink(framework_update_file)
-        os.unlink(framework_update_meta_file)
+        with open(framework_update_meta_file, 'r') as fup_mf:
+            metadata = json.load(fup_mf)
+        journal = find_journal(install_directory, package_digest(metadata)[1])
+    except (IOError, JSONDecodeError, KeyError, AttributeError):
+        print('Failed to read package metadata')
+        print_traceback()
+        remove_update_package(data_directory)
         return
 
+    if journal is not None:
+        journal = resume_installation(journal)
+
+    if journal is None:
+        journal = extract_update_package(framework_update_file, metadata, install_directory, base_directories)
+        if journal is None:
+            remove_update_package(data_directory)
+            return
+
     # try to read package version
     # integrity check done by installed package, now only get the version
-    version_to_install = read_version(os.path.join(tmp_dir, 'manifest.json'))
+    version_to_install = read_version(os.path.join(journal.directory, 'manifest.json'))
 
     print('Reading package version')
     if version_to_install is None:
         print('Failed to read package version')
-        shutil.rmtree(tmp_dir)
-        os.unlink(framework_update_file)
-        os.unlink(framework_update_meta_file)
+        move_to_trash(journal.directory, trash_directory(install_directory))
+        remove_update_package(data_directory)
         return
 
     target_dir = os.path.join(install_directory, dir_for_version(version_to_install))
-    if os.path.isdir(target_dir):
-        print('Update seems to already been installed, skipping')
-        # we don't want to install this package, remove sources
-        shutil.rmtree(tmp_dir)
-        os.unlink(framework_update_file)
-        os.unlink(framework_update_meta_file)
+    if journal.directory == tmp_dir:
+        if os.path.isdir(target_dir):
+            print('Update seems to already been installed, skipping')
+            # we don't want to install this package, remove sources
+            move_to_trash(tmp_dir, trash_directory(install_directory))
+            remove_update_package(data_directory)
+            return
+
+        print('Installing version: {}'.format(version_to_install))
+        print('Renaming {} to {}'.format(tmp_dir, target_dir))
+        os.rename(tmp_dir, target_dir)
+        journal.directory = target_dir
+
+    if not setup_venv(install_directory, target_dir, journal):
+        attempts = journal.details.get('setup_attempts', 0) + 1
+        print('Failed to set up {}, attempt {} of {}'.format(target_dir, attempts, MAX_SETUP_ATTEMPTS))
+        if attempts >= MAX_SETUP_ATTEMPTS:
+            # the failure is permanent, e.g. a missing wheel, don't retry it at every start
+            move_to_trash(target_dir, trash_directory(install_directory))
+            remove_update_package(data_directory)
+        else:
+            # keep the journal and the update package, the installation is resumed at the next start
+            journal.update(setup_attempts=attempts)
         return
 
-    print('Installing version: {}'.format(version_to_install))
-    print('Renaming {} to {}'.format(tmp_dir, target_dir))
-    shutil.move(tmp_dir, target_dir)
-
-    print('Running setup')
-    lines = [
-        # setup virtual env
-        'echo "Setting up venv"',
-        'python3 -m venv {}/install/venv'.format(target_dir),
-        # activate venv
-        'echo "Activating venv"',
-        'sh {}/install/venv/bin/activate'.format(target_dir),
-        # install pip dependencies
-        'echo "Installing dependencies"',
-        'python3 -m pip install --no-cache-dir -r {0}/requirements.txt --no-index --find-links file:///{0}/packages'
-        .format(os.path.join(target_dir, 'install')),
-        # create file that signals finished installation
-        'touch {}/installed'.format(target_dir)
-    ]
-    subprocess_cmd("\n".join(lines))
+    if not journal.done(COMPILED):
+        precompile(target_dir)
+        journal.complete(COMPILED)
+
+    deduplicate_installation(install_directory, target_dir)
+
+    # create file that signals finished installation
+    with open(os.path.join(target_dir, 'installed'), 'w'):
+        pass
+    journal.remove()
+
+    update_index(install_directory, read_version)
 
     print('Removing update package')
-    os.unlink(framework_update_file)
-    os.unlink(framework_update_meta_file)
+    remove_update_package(data_directory)
 
 
-def select_newest_package(directory, skipped_versions):
+@traced('select')
+def select_newest_package(directory, skipped_versions, installed_only=False):
     """Finds latest, non blacklisted framework version.
 
-    Checks all subdirectories in directory, reads the version information from
-    the manifest.json files.
+    Looks up the newest version in the index of the directory. The index is
+    rebuilt by reading the manifest.json files of all subdirectories if it is
+    missing, the directory was modified since it was written, or the manifest
+    of the selected version changed.
 
     Args:
         directory: Base directory of installed frameworks.
         skipped_versions: List of path names of framework versions to be
             skipped.
+        installed_only: Skip versions without the 'installed' placeholder.
 
     Returns:
         String path for the newest version.
     """
-    newest = Version("0.0")
-    newest_path = None
+    entry = None
 
     # find newest framework
     try:
-        for fw_dir in os.listdir(directory):
-            fw_dir = os.path.join(directory, fw_dir)
-            if fw_dir not in skipped_versions:
-                manifest_file = os.path.join(fw_dir, 'manifest.json')
-                if os.path.isfile(manifest_file):
-                    version = read_version(manifest_file)
-                    if version is not None and (newest is None or newest < version):
-                        newest = version
-                        print('Found version {}'.format(version))
-                        newest_path = os.path.join(directory, dir_for_version(version))
+        index = load_index(directory)
+        if index is None:
+            print('Indexing {}'.format(directory))
+            index = update_index(directory, read_version)
+
+        entry = newest_entry(index, directory, skipped_versions, installed_only)
+        if entry is not None and not entry_is_current(directory, entry):
+            print('Version index of {} is outdated, rescanning'.format(directory))
+            index = update_index(directory, read_version)
+            entry = newest_entry(index, directory, skipped_versions, installed_only)
     except FileNotFoundError:
         print('Failed to select newest package')
-        print(traceback.format_exc())
+        print_traceback()
+
+    if entry is None:
+        return None
 
-    return newest_path
+    print('Found version {}'.format(entry['version']))
+    return os.path.join(directory, dir_for_version(Version(entry['version'])))
 
 
-def start_framework(path):
-    """Runs revvy framework in its virtualenv.
+async def framework_started(process):
+    """Finishes the boot trace once the framework process is running."""
+    mark('framework_started', pid=process.pid)
+    end_boot()
+
+
+def start_framework(path, history_file=None, installer=None, launches=None, tasks=(), resources_file=None,
+                    wall_clock=time.time, sleep=time.sleep):
+    """Runs revvy framework with the interpreter of its virtualenv.
+
+    If the framework exits with an error, it is restarted with an
+    exponentially growing delay, as long as it has crashed fewer times than
+    its restart budget allows. The restart policy is read from the manifest,
+    see restart_policy.py.
+    The resource usage of the framework is monitored. If it exceeds the limits
+    in the manifest, see resource_monitor.py, the framework is stopped and
+    restarted as if it had crashed.
 
     Args:
         path: (String) Path to directory containing the revvy code.
+        history_file: Path of the file that keeps the crash history across
+            launcher restarts, or None to keep it in memory.
+        installer: The BackgroundInstaller if updates are installed while the
+            framework runs. The framework is then stopped when a switch to the
+            newest version is requested with SIGUSR1, and is not restarted
+            after an error if an update has been installed meanwhile.
+        launches: LaunchHistory to record the launches and successful runs
+            of the framework in, or None.
+        tasks: Additional Supervisor tasks to run alongside the framework.
+        resources_file: Path of the file the resource usage of the last run
+            is saved to, or None.
+        wall_clock: Wall clock time source in seconds.
+        sleep: Function that waits before a restart.
 
     Returns:
         Integer error code.
         See revvy/utils.py's RevvyStatusCode for actual codes.
         0 - OK
         other - ERROR, INTEGRITY_ERROR, UPDATE_REQUEST, etc...
+        If the restart budget is exhausted, INTEGRITY_ERROR (2) is returned so
+        that the version is skipped.
     """
+    from resource_monitor import ResourceMonitor, read_monitor_config
+
+    policy = read_restart_policy(os.path.join(path, 'manifest.json'))
+    monitor_config = read_monitor_config(os.path.join(path, 'manifest.json'))
+    history = RestartHistory(history_file)
+
     script_lives = True
     return_value = 0
     while script_lives:
+        if budget_exhausted(history.runs(path), policy, wall_clock()):
+            print('{} crashed too often, skipping'.format(path))
+            return 2
+
         print('Starting {}'.format(path))
-        lines = [
-            # activate venv
-            'sh {}/install/venv/bin/activate'.format(path),
-            # start script
-            'python3 -u {}/revvy.py'.format(path)
-        ]
+        command, env = framework_command(path)
+        monitor = ResourceMonitor(monitor_config)
         try:
-            return_value = subprocess_cmd("\n".join(lines))
+            framework_tasks = [framework_started, monitor.watch] + list(tasks)
+            if installer is not None:
+                from background_install import watch_switch_request
+                framework_tasks.append(watch_switch_request)
+            if launches is not None:
+                framework_tasks.append(launch_recorder(launches, path, policy['stable_runtime']))
+            result = get_supervisor().run(command, tasks=framework_tasks, env=env)
+            return_value = result.returncode
+            print('Script exited with {} after {:.1f} seconds'.format(return_value, result.runtime))
+            if result.signal is not None:
+                print('Script was killed by signal {}'.format(result.signal))
+            print('Resource usage: {}'.format(monitor.summary()))
+            if resources_file is not None:
+                monitor.dump(resources_file, path, result)
+            if monitor.tripped is not None:
+                # restart with backoff, counted against the restart budget
+                return_value = 1
+            history.record(path, wall_clock(), result.runtime, return_value)
+            if launches is not None and return_value == 0:
+                launches.succeeded(path, wall_clock())
         except KeyboardInterrupt:
             return_value = 0
-
-        print('Script exited with {}'.format(return_value))
-        if return_value == 1:
-            # if script dies with error, restart [maybe measure runtime and if shorter than X and disable]
-            pass
+        except OSError:
+            # the virtualenv is broken, treat it like an integrity error so the version is skipped
+            print('Failed to start {}'.format(path))
+            print_traceback()
+            return_value = 2
+
+        if return_value == 1 and installer is not None and installer.finished:
+            # the next start should use the newly installed version
+            print('Update installed, switching version')
+            script_lives = False
+        elif return_value == 1:
+            # if script dies with error, restart after a delay that grows with consecutive early crashes
+            delay = backoff_delay(history.runs(path), policy)
+            if delay > 0 and not budget_exhausted(history.runs(path), policy, wall_clock()):
+                print('Restarting in {:.1f} seconds'.format(delay))
+                sleep(delay)
         else:
             script_lives = False
 
     return return_value
 
 
-def startup(directory):
+def configure_gpio(fake_directory=None):
+    """Sets up the GPIO backend and configures AMP_EN as input.
+
+    Falls back to the 'gpio' utility if the pin can't be configured through
+    sysfs.
+
+    Args:
+        fake_directory: Directory to read fake pin values from, or None to use
+            the hardware.
+
+    Returns:
+        The configured GpioBackend.
+    """
+    gpio = create_gpio_backend(fake_directory)
+    try:
+        gpio.configure_input(AMP_EN_PIN)
+    except GpioError as e:
+        print('{}, falling back to gpio utility'.format(e))
+        gpio = CommandGpio()
+        gpio.configure_input(AMP_EN_PIN)
+
+    return gpio
+
+
+def restart_budget_wait(path, history_file, wall_clock=time.time):
+    """Returns how many seconds to wait until a framework version that crashed too often may be restarted."""
+    policy = read_restart_policy(os.path.join(path, 'manifest.json'))
+    return budget_wait(RestartHistory(history_file).runs(path), policy, wall_clock())
+
+
+def startup(directory, argv=None, gpio=None, supervisor=None, clock=time.monotonic, wall_clock=time.time,
+            sleep=time.sleep, trash_reclaimer=TrashReclaimer):
     """Runs revvy from directory.
 
-    Handles the command line arguments of the script.
-    Currently the only one is --install-only, which terminates execution after
-    install.
+    Handles the command line arguments of the script, e.g. --install-only,
+    which terminates execution after install, or --profile-boot, which prints
+    the time spent in each phase of the boot before the framework starts.
+    Boot phase timings are appended to user/boot_trace.jsonl.
 
     Steps:
-    - Cleanup failed installations
-    - Search for fw update and install it
+    - Cleanup failed installations, and delete them in a low priority process
+    - Search for fw update and install it, or with --background-install,
+      start installing it in a low priority process
+    - Remove old versions, keeping the newest known good ones and the last
+      one that ran successfully, see --keep-versions and --disk-quota
+    - Wait until the devices required by the latest version are ready
     - Execute latest version
     - If execution terminates normally, finish
     - If execution terminates with integrity_error, exclude version and retry
     - Otherwise restart the same version
 
+    The GPIO pins, the processes, the clocks, sleeping and emptying the trash
+    can be replaced, e.g. to simulate boots on any machine, see
+    tools/simulate_boot.py.
+
     Args:
         directory: Base directory containing installed version of the revvy
             framework.
+        argv: Command line arguments, defaults to sys.argv.
+        gpio: GpioBackend to read AMP_EN from, instead of the hardware.
+        supervisor: Supervisor to run the framework and the installation
+            commands with.
+        clock: Monotonic time source in seconds, for the boot trace and the
+            readiness checks.
+        wall_clock: Wall clock time source in seconds, for the histories.
+        sleep: Function that waits the given number of seconds.
+        trash_reclaimer: Class that empties the trash of the installation
+            directory in the background, see trash.TrashReclaimer.
     """
+    import argparse
+    global _supervisor
+
     parser = argparse.ArgumentParser()
     parser.add_argument('--install-only', help='Install updates but do not start framework', action='store_true')
     parser.add_argument('--install-default', help='Install the default package. Requires --install-only'
                                                   ' and the filesystem must be writeable.', action='store_true')
-
-    args = parser.parse_args()
+    parser.add_argument('--background-install', help='Start the framework right away and install updates in a low'
+                                                     ' priority process. Send SIGUSR1 to switch to the new version.',
+                        action='store_true')
+    parser.add_argument('--profile-boot', help='Print the time spent in each phase of the boot',
+                        action='store_true')
+    parser.add_argument('--daemon', help='Keep running: install updates as soon as they are uploaded and accept'
+                                         ' commands on user/launcher.sock. Implies --background-install.',
+                        action='store_true')
+    parser.add_argument('--keep-versions', help='Number of known good versions to keep installed',
+                        type=int, default=DEFAULT_KEEP_VERSIONS)
+    parser.add_argument('--disk-quota', help='Remove the least recently used versions if the installed versions use'
+                                             ' more space than this, in MiB', type=int)
+    parser.add_argument('--fake-gpio', help='Read GPIO pins from files in this directory instead of the hardware',
+                        metavar='DIRECTORY')
+
+    args = parser.parse_args(argv)
+
+    if supervisor is not None:
+        _supervisor = supervisor
 
     skipped_versions = []
+    launches = LaunchHistory(os.path.join(directory, 'user', 'launch_history.json'))
+    quota = None if args.disk_quota is None else args.disk_quota * 1024 * 1024
+
+    installer = None
+    if (args.background_install or args.daemon) and not args.install_only:
+        from background_install import BackgroundInstaller, install_switch_handler
+        installer = BackgroundInstaller(os.path.abspath(__file__), directory)
+        install_switch_handler()
 
     if args.install_only and args.install_default:
         install_directory = os.path.join(directory, default_package_dir)
@@ -373,49 +960,95 @@ def startup(directory):
     print('Install directory: {}'.format(install_directory))
     print('Data directory: {}'.format(data_directory))
 
+    daemon = None
+    if args.daemon and not args.install_only:
+        from daemon import Daemon
+        daemon = Daemon(data_directory, os.path.join(directory, 'user', 'launcher.sock'), installer, skipped_versions)
+        daemon.start(get_supervisor())
+        # serve the commands and detect uploads while waiting, not only while the framework runs
+        sleep = daemon.sleep
+
     stop = False
     while not stop:
-        cleanup_invalid_installations(install_directory)
-        if has_update_package(data_directory):
-            install_update_package(data_directory, install_directory)
+        begin_boot(os.path.join(directory, 'user', 'boot_trace.jsonl'), args.profile_boot, clock)
+        if installer is not None and installer.running:
+            # the installer owns the installation directory until it finishes
+            print('Background installation in progress')
+        else:
+            cleanup_invalid_installations(install_directory, pending_package_hash(data_directory))
+            if has_update_package(data_directory):
+                if installer is not None:
+                    installer.start()
+                else:
+                    install_update_package(data_directory, install_directory)
+            if not args.install_only:
+                enforce_retention(install_directory, launches, args.keep_versions, quota)
+            # removed versions are deleted while the framework starts
+            reclaim_trash(install_directory, trash_reclaimer)
 
         if args.install_only:
             print('--install-only flag is set, exiting')
+            end_boot()
             stop = True
         else:
-            # configure AMP_EN to input
-            subprocess_cmd("gpio -g mode 22 in")
+            if gpio is None:
+                gpio = configure_gpio(args.fake_gpio)
 
             # read AMP_EN to detect if Revvy is ON
-            amp_en = subprocess.check_output(["gpio", "read", "3"])
-            while amp_en != b'1\n':
+            if not gpio.read(AMP_EN_PIN):
                 print("Device is off... waiting")
-                time.sleep(1)
-                amp_en = subprocess.check_output(["gpio", "read", "3"])
+                with span('gpio_wait'):
+                    if daemon is None:
+                        gpio.wait_for_high(AMP_EN_PIN)
+                    else:
+                        daemon.call_blocking(gpio.wait_for_high, AMP_EN_PIN)
 
             print("Device is on, start framework")
-            # delay to wait hciuart device
-            time.sleep(1)
             # try to look for a working update package
-            path = select_newest_package(install_directory, skipped_versions)
-            if not path:
+            path = select_newest_package(install_directory, skipped_versions, True)
+            last_candidate = not path
+            if last_candidate:
                 # if there is no such package, start the built in one
                 path = select_newest_package(default_package_dir, [])
 
             if path:
-                return_value = start_framework(path)
+                # wait for the devices the framework needs, e.g. hciuart
+                readiness = read_readiness_config(os.path.join(path, 'manifest.json'))
+                with span('readiness_wait'):
+                    ready = wait_until_ready(readiness, clock, sleep)
+                if not ready:
+                    print('Device not ready, starting framework anyway')
+
+                history_file = os.path.join(directory, 'user', 'restart_history.json')
+                tasks = [] if daemon is None else [daemon.tracker(path)]
+                resources_file = os.path.join(directory, 'user', 'framework_resources.json')
+                return_value = start_framework(path, history_file, installer, launches, tasks, resources_file,
+                                               wall_clock, sleep)
+                if installer is not None and installer.finished:
+                    installer.reset()
                 if return_value == 0:
                     print('Manual exit')
                     stop = True
                 elif return_value == 2:
-                    # if script dies with integrity error, restart process and skip framework
-                    print('Integrity error - add {} to skipped list'.format(path))
-                    skipped_versions.append(path)
+                    # if script dies with integrity error or keeps crashing, restart process and skip framework
+                    if path not in skipped_versions:
+                        print('Integrity error - add {} to skipped list'.format(path))
+                        skipped_versions.append(path)
+                    if last_candidate:
+                        # the built in package is never skipped, wait until it may be restarted again
+                        delay = restart_budget_wait(path, history_file, wall_clock)
+                        if delay > 0:
+                            print('No other package to try, restarting {} in {:.1f} seconds'.format(path, delay))
+                            sleep(delay)
             else:
                 # if, for some reason there is no built-in package, stop
                 print('There are no more packages to try - exit')
+                end_boot()
                 stop = True
 
+    if daemon is not None:
+        daemon.close()
+
 
 def main(directory):
     startup(directory)
@@ -0,0 +1,103 @@
+import os
+import stat
+
+from package_digest import hash_file
+
+
+# directory inside the installation directory that holds the file contents shared between versions
+OBJECT_STORE_DIR = '.objects'
+
+
+def store_directory(install_directory):
+    """Returns the object store of an installation directory.
+
+    The store must be on the same filesystem as the installed versions so
+    that hard links can be used.
+    """
+    return os.path.join(install_directory, OBJECT_STORE_DIR)
+
+
+def object_path(store_dir, digest, mode):
+    """Returns the path of an object.
+
+    Hard linked files share their permissions, so the mode is part of the key.
+
+    >>> object_path('.objects', 'd41d8cd98f00b204e9800998ecf8427e', 0o644)
+    '.objects/d4/d41d8cd98f00b204e9800998ecf8427e-644'
+    """
+    return os.path.join(store_dir, digest[:2], '{}-{:o}'.format(digest, stat.S_IMODE(mode)))
+
+
+def add_tree(root, store_dir):
+    """Deduplicates the files of a directory tree through the object store.
+
+    Every regular, non-empty file is either linked into the store as a new
+    object, or, if an identical object already exists, replaced by a hard link
+    to that object. Files must not be modified in place after this, since
+    their contents may be shared with other versions.
+
+    Args:
+        root: Directory tree to deduplicate.
+        store_dir: Object store directory.
+
+    Returns:
+        Number of bytes freed by replacing files with links.
+    """
+    freed = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            st = os.lstat(path)
+            if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+                continue
+
+            if st.st_nlink > 1:
+                # already shared with the store or another installation, e.g. cloned or linked from the base version
+                continue
+
+            target = object_path(store_dir, hash_file(path, 'md5', cache=False), st.st_mode)
+            try:
+                if os.path.samestat(os.stat(target), st):
+                    continue
+
+                link_path = path + '.lnk'
+                if os.path.lexists(link_path):
+                    os.unlink(link_path)  # left behind by an interrupted run
+                os.link(target, link_path)
+                os.replace(link_path, path)
+                freed += st.st_size
+            except FileNotFoundError:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.link(path, target)
+
+    return freed
+
+
+def collect_garbage(store_dir):
+    """Removes objects that are not linked into any installed version.
+
+    Args:
+        store_dir: Object store directory.
+
+    Returns:
+        Number of bytes freed.
+    """
+    freed = 0
+    try:
+        buckets = os.listdir(store_dir)
+    except FileNotFoundError:
+        return 0
+
+    for bucket in buckets:
+        bucket = os.path.join(store_dir, bucket)
+        for name in os.listdir(bucket):
+            path = os.path.join(bucket, name)
+            st = os.lstat(path)
+            if st.st_nlink == 1:
+                os.unlink(path)
+                freed += st.st_size
+
+        if not os.listdir(bucket):
+            os.rmdir(bucket)
+
+    return freed
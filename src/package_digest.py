@@ -0,0 +1,166 @@
+import json
+import os
+import time
+
+
+# digests an update package can be declared with in its metadata, e.g. {"length": 1234, "sha256": "..."}
+SUPPORTED_ALGORITHMS = ('md5', 'sha256', 'blake2b')
+
+# size of the blocks read when hashing a whole file, a multiple of the page size
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# sidecar file of an update package that records its verified digests
+CACHE_SUFFIX = '.verified'
+
+# bytes per second of each algorithm on this machine, see fastest_algorithm
+_throughput = {}
+
+
+def new_hash(algorithm):
+    """Returns a new hash object, or None if the algorithm is not available, e.g. blake2b before python 3.6."""
+    import hashlib  # only needed when a package is hashed, see tools/import_budget.py
+    constructor = getattr(hashlib, algorithm, None) if algorithm in SUPPORTED_ALGORITHMS else None
+    return constructor() if constructor is not None else None
+
+
+def _measure(algorithm, size=256 * 1024):
+    hash_fn = new_hash(algorithm)
+    data = bytes(size)
+    start = time.perf_counter()
+    hash_fn.update(data)
+    return size / max(time.perf_counter() - start, 1e-9)
+
+
+def fastest_algorithm(algorithms):
+    """Returns the algorithm that hashes the fastest on this machine.
+
+    The speed of each algorithm is measured once per process.
+    """
+    for algorithm in algorithms:
+        if algorithm not in _throughput:
+            _throughput[algorithm] = _measure(algorithm)
+    return max(algorithms, key=_throughput.get)
+
+
+def package_digest(metadata):
+    """Chooses the digest an update package is verified with.
+
+    If the metadata declares more than one supported digest, the one that is
+    the fastest to calculate is used.
+
+    >>> package_digest({'length': 3, 'md5': 'abc'})
+    ('md5', 'abc')
+    >>> package_digest({'length': 3, 'md5': None})
+    (None, None)
+
+    Args:
+        metadata: Contents of the '2.meta' file of the package.
+
+    Returns:
+        A tuple of the algorithm and the expected hex digest, or
+        (None, None) if no supported digest is declared.
+    """
+    algorithms = [a for a in SUPPORTED_ALGORITHMS if metadata.get(a) and new_hash(a) is not None]
+    if not algorithms:
+        return None, None
+
+    algorithm = algorithms[0] if len(algorithms) == 1 else fastest_algorithm(algorithms)
+    return algorithm, metadata[algorithm]
+
+
+def _cache_key(st):
+    return [st.st_ino, st.st_size, st.st_mtime_ns, st.st_ctime_ns]
+
+
+def _recorded_digests(package_file, st):
+    try:
+        with open(package_file + CACHE_SUFFIX, 'r') as f:
+            cache = json.load(f)
+        if cache['key'] != _cache_key(st):
+            return {}  # the file was replaced or modified
+        return dict(cache['digests'])
+    except (IOError, ValueError, KeyError, TypeError):
+        return {}
+
+
+def cached_digest(package_file, algorithm, st=None):
+    """Returns the digest recorded by record_digest, or None if the file changed since.
+
+    Args:
+        package_file: Path of the update package.
+        algorithm: Name of the hash algorithm.
+        st: os.stat result of the package, if already known.
+    """
+    try:
+        if st is None:
+            st = os.stat(package_file)
+    except IOError:
+        return None
+    return _recorded_digests(package_file, st).get(algorithm)
+
+
+def record_digest(package_file, algorithm, digest, st=None):
+    """Records the verified digest of a file next to it.
+
+    The record is only valid as long as the inode, size and modification
+    time of the file stay the same.
+    """
+    try:
+        if st is None:
+            st = os.stat(package_file)
+        digests = _recorded_digests(package_file, st)
+        digests[algorithm] = digest
+        with open(package_file + CACHE_SUFFIX + '.tmp', 'w') as f:
+            json.dump({'key': _cache_key(st), 'digests': digests}, f)
+        os.replace(package_file + CACHE_SUFFIX + '.tmp', package_file + CACHE_SUFFIX)
+    except IOError:
+        print('Failed to record digest of {}'.format(package_file))
+
+
+def remove_cache(package_file):
+    try:
+        os.unlink(package_file + CACHE_SUFFIX)
+    except FileNotFoundError:
+        pass
+
+
+def hash_file(package_file, algorithm, progress=None, cache=True):
+    """Calculates the digest of a file, unless it's recorded already.
+
+    The file is read in HASH_CHUNK_SIZE blocks into a reused buffer.
+
+    Args:
+        package_file: Path of the file.
+        algorithm: Name of the hash algorithm.
+        progress: Called with the number of bytes of each block read.
+        cache: Use and record the digest recorded next to the file, see
+            record_digest. Only update packages are recorded, other files
+            are hashed with cache=False.
+
+    Returns:
+        The hex digest.
+
+    Raises:
+        IOError: An error occurred during reading the file.
+    """
+    with open(package_file, 'rb', buffering=0) as f:
+        st = os.fstat(f.fileno())
+        digest = cached_digest(package_file, algorithm, st) if cache else None
+        if digest is not None:
+            return digest
+
+        hash_fn = new_hash(algorithm)
+        buffer = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while True:
+            length = f.readinto(buffer)
+            if not length:
+                break
+            hash_fn.update(view[:length])
+            if progress is not None:
+                progress(length)
+
+    digest = hash_fn.hexdigest()
+    if cache:
+        record_digest(package_file, algorithm, digest, st)
+    return digest
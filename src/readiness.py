@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+
+# hciuart registers the bluetooth controller as hci0 once the UART link is up
+DEFAULT_READINESS = {
+    'checks': [{'path': '/sys/class/bluetooth/hci0'}],
+    'timeout': 3.0
+}
+
+MIN_POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.2
+
+
+def read_readiness_config(manifest_file):
+    """Reads the readiness checks of a framework from its manifest.
+
+    The optional 'readiness' object of the manifest contains a list of
+    'checks' and a 'timeout' in seconds. Each check has a 'path' that must
+    exist and optionally a string it must 'contain', e.g. a sysfs attribute.
+
+    Args:
+        manifest_file: Path to a json formatted manifest file.
+
+    Returns:
+        The readiness config, or DEFAULT_READINESS if the manifest doesn't
+        specify a valid one.
+    """
+    try:
+        with open(manifest_file, 'r') as mf:
+            config = json.load(mf)['readiness']
+        checks = [{'path': str(check['path']), 'contains': check.get('contains')} for check in config['checks']]
+        return {'checks': checks, 'timeout': float(config.get('timeout', DEFAULT_READINESS['timeout']))}
+    except KeyError:
+        return DEFAULT_READINESS
+    except (IOError, ValueError, TypeError, AttributeError):
+        print('Invalid readiness config in {}, using default'.format(manifest_file))
+        return DEFAULT_READINESS
+
+
+def check_condition(check):
+    """Returns True if a readiness check is satisfied.
+
+    >>> check_condition({'path': '/'})
+    True
+    >>> check_condition({'path': '/nonexistent'})
+    False
+    """
+    contains = check.get('contains')
+    if contains is None:
+        return os.path.exists(check['path'])
+
+    try:
+        with open(check['path'], 'r') as f:
+            return contains in f.read()
+    except IOError:
+        return False
+
+
+def wait_until_ready(config, clock=time.monotonic, sleep=time.sleep):
+    """Waits until all readiness checks are satisfied or the timeout expires.
+
+    Conditions are polled, starting with a short interval that is doubled
+    after every unsuccessful round, so conditions that are met quickly cost
+    little latency and slow ones cost little CPU.
+
+    Args:
+        config: Readiness config, see read_readiness_config.
+        clock: Monotonic time source in seconds.
+        sleep: Function to wait for the given number of seconds.
+
+    Returns:
+        True if the device is ready, False on timeout.
+    """
+    deadline = clock() + config['timeout']
+    interval = MIN_POLL_INTERVAL
+    pending = list(config['checks'])
+    while True:
+        pending = [check for check in pending if not check_condition(check)]
+        if not pending:
+            return True
+
+        remaining = deadline - clock()
+        if remaining <= 0:
+            print('Not ready: {}'.format(', '.join(check['path'] for check in pending)))
+            return False
+
+        sleep(min(interval, remaining))
+        interval = min(interval * 2, MAX_POLL_INTERVAL)
@@ -0,0 +1,211 @@
+import asyncio
+import collections
+import os
+import time
+
+from json_file import read_manifest_section, save_json
+
+
+DEFAULT_MONITOR = {
+    # seconds between samples
+    'interval': 2.0,
+    # number of samples kept, and dumped when the framework exits
+    'samples': 150,
+    # the framework is restarted if its resident memory exceeds this many MiB, 0 disables
+    'max_rss': 0.0,
+    # ... or if it uses at least this fraction of a core for spin_duration seconds, 0 disables
+    'max_cpu': 0.0,
+    'spin_duration': 60.0,
+    # ... or if it doesn't print anything for this many seconds, 0 disables
+    'silence_timeout': 0.0
+}
+
+MIB = 1024 * 1024
+
+
+class ResourceSample(collections.namedtuple('ResourceSample', ['time', 'cpu', 'rss', 'read_bytes', 'write_bytes'])):
+    """Resource usage of a process.
+
+    Attributes:
+        time: Seconds since the process started.
+        cpu: Fraction of a core used since the previous sample, None for the
+            first one.
+        rss: Resident memory in bytes.
+        read_bytes, write_bytes: Bytes read from and written to the storage
+            since the process started, None if not available.
+    """
+    __slots__ = ()
+
+
+def read_monitor_config(manifest_file):
+    """Reads the resource limits of a framework from its manifest.
+
+    Values missing from the optional 'monitor' object of the manifest are
+    taken from DEFAULT_MONITOR.
+
+    Args:
+        manifest_file: Path to a json formatted manifest file.
+
+    Returns:
+        The monitor config as a dict.
+    """
+    return read_manifest_section(manifest_file, 'monitor', DEFAULT_MONITOR, 'monitor config')
+
+
+def read_process_usage(pid, proc='/proc'):
+    """Reads the resource usage of a process from procfs.
+
+    Returns:
+        A tuple of the consumed CPU time in seconds, the resident memory in
+        bytes, and the bytes read from and written to the storage, which are
+        None if /proc/<pid>/io can't be read. None if the process is gone.
+    """
+    directory = os.path.join(proc, str(pid))
+    try:
+        with open(os.path.join(directory, 'stat'), 'r') as f:
+            # the command name may contain spaces, the fields after it don't
+            fields = f.read().rsplit(')', 1)[1].split()
+        # utime and stime, fields 14 and 15 of proc(5)
+        cpu_time = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+        rss = 0
+        with open(os.path.join(directory, 'status'), 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss = int(line.split()[1]) * 1024
+                    break
+    except (IOError, IndexError, ValueError):
+        return None
+
+    read_bytes, write_bytes = None, None
+    try:
+        with open(os.path.join(directory, 'io'), 'r') as f:
+            counters = dict(line.split(':', 1) for line in f if ':' in line)
+        read_bytes, write_bytes = int(counters['read_bytes']), int(counters['write_bytes'])
+    except (IOError, KeyError, ValueError):
+        pass
+
+    return cpu_time, rss, read_bytes, write_bytes
+
+
+def exceeded_limit(config, samples, silence):
+    """Checks the resource usage of a process against the limits of config.
+
+    >>> config = dict(DEFAULT_MONITOR, max_rss=100.0, max_cpu=0.9, spin_duration=4.0, silence_timeout=30.0)
+    >>> samples = [ResourceSample(t, cpu, 50 * MIB, 0, 0) for t, cpu in [(0, None), (2, 1.0), (4, 0.95)]]
+    >>> exceeded_limit(config, samples, 0.0)
+    'CPU above 90% for 4 seconds'
+    >>> exceeded_limit(config, samples[:2], 0.0) is None
+    True
+    >>> exceeded_limit(config, samples[:2], 31.0)
+    'No output for 31 seconds'
+    >>> exceeded_limit(config, [ResourceSample(0, None, 101 * MIB, 0, 0)], 0.0)
+    'Resident memory above 100 MiB'
+
+    Args:
+        config: Monitor config, see read_monitor_config.
+        samples: Samples of the process, oldest first.
+        silence: Seconds since the process printed anything.
+
+    Returns:
+        The reason to restart the process, or None.
+    """
+    if config['silence_timeout'] and silence >= config['silence_timeout']:
+        return 'No output for {:.0f} seconds'.format(silence)
+
+    if not samples:
+        return None
+
+    latest = samples[-1]
+    if config['max_rss'] and latest.rss > config['max_rss'] * MIB:
+        return 'Resident memory above {:.0f} MiB'.format(config['max_rss'])
+
+    if config['max_cpu']:
+        # the cpu of a sample is measured since the previous one
+        spinning_since = samples[0].time
+        for sample in reversed(samples):
+            if sample.cpu is None or sample.cpu < config['max_cpu']:
+                spinning_since = sample.time
+                break
+        if latest.time - spinning_since >= config['spin_duration']:
+            return 'CPU above {:.0f}% for {:.0f} seconds'.format(config['max_cpu'] * 100, latest.time - spinning_since)
+
+    return None
+
+
+class ResourceMonitor:
+    """Samples the resource usage of the framework and restarts it if it exceeds its limits.
+
+    The CPU time, resident memory and storage I/O of the process are read
+    from procfs every 'interval' seconds, the last 'samples' samples are kept.
+    If a limit is exceeded, the process is terminated and tripped holds the
+    reason.
+
+    Args:
+        config: Monitor config, see read_monitor_config.
+        clock: Monotonic time source in seconds.
+    """
+
+    def __init__(self, config, clock=time.monotonic):
+        self.config = config
+        self.samples = collections.deque(maxlen=max(1, config['samples']))
+        self.tripped = None
+        self._clock = clock
+
+    async def watch(self, process):
+        """Supervisor task that monitors process."""
+        last = None
+        while True:
+            usage = read_process_usage(process.pid)
+            if usage is None:
+                return  # exited
+
+            now = self._clock()
+            cpu = None
+            if last is not None and now > last[0]:
+                cpu = (usage[0] - last[1]) / (now - last[0])
+            last = (now, usage[0])
+            self.samples.append(ResourceSample(round(now - process.started, 3), cpu, *usage[1:]))
+
+            reason = exceeded_limit(self.config, self.samples, now - process.last_output)
+            if reason is not None:
+                print('{}, restarting the framework'.format(reason))
+                self.tripped = reason
+                await process.terminate()
+                return
+
+            await asyncio.sleep(self.config['interval'])
+
+    def summary(self):
+        """Describes the recorded samples in a line.
+
+        >>> monitor = ResourceMonitor(DEFAULT_MONITOR)
+        >>> monitor.samples.extend([ResourceSample(0, None, MIB, 0, 0), ResourceSample(2, 0.5, 3 * MIB, 0, 4096)])
+        >>> monitor.summary()
+        'peak RSS 3.0 MiB, mean CPU 50%, 0 bytes read, 4096 bytes written'
+        """
+        if not self.samples:
+            return 'no samples'
+
+        cpu = [sample.cpu for sample in self.samples if sample.cpu is not None]
+        latest = self.samples[-1]
+        return 'peak RSS {:.1f} MiB, mean CPU {:.0f}%, {} bytes read, {} bytes written'.format(
+            max(sample.rss for sample in self.samples) / MIB, 100 * sum(cpu) / len(cpu) if cpu else 0,
+            latest.read_bytes, latest.write_bytes)
+
+    def dump(self, file, path, result):
+        """Saves the recorded samples with the outcome of the run, for diagnosing it later.
+
+        Args:
+            file: Path of the json file, replaced by every run.
+            path: Directory of the framework version.
+            result: The ProcessResult of the run.
+        """
+        save_json(file, {
+            'path': path,
+            'returncode': result.returncode,
+            'runtime': result.runtime,
+            'tripped': self.tripped,
+            'fields': ResourceSample._fields,
+            'samples': list(self.samples)
+        }, 'resource samples')
@@ -0,0 +1,136 @@
+import random
+
+from json_file import load_json, read_manifest_section, save_json
+
+
+DEFAULT_RESTART_POLICY = {
+    # delay before the first restart after a crash, in seconds
+    'initial_delay': 1.0,
+    # upper limit of the delay between restarts
+    'max_delay': 60.0,
+    # the delay is multiplied by this after every consecutive crash
+    'multiplier': 2.0,
+    # relative random variation of the delay
+    'jitter': 0.2,
+    # runs that last at least this long reset the backoff
+    'stable_runtime': 60.0,
+    # number of crashes allowed within the window before the version is skipped
+    'budget': 5,
+    'window': 600.0
+}
+
+# number of runs remembered per version
+HISTORY_LENGTH = 50
+
+
+def read_restart_policy(manifest_file):
+    """Reads the restart policy of a framework from its manifest.
+
+    Values missing from the optional 'restart_policy' object of the manifest
+    are taken from DEFAULT_RESTART_POLICY.
+
+    Args:
+        manifest_file: Path to a json formatted manifest file.
+
+    Returns:
+        The restart policy as a dict.
+    """
+    return read_manifest_section(manifest_file, 'restart_policy', DEFAULT_RESTART_POLICY, 'restart policy')
+
+
+class RestartHistory:
+    """Runs of framework versions, persisted across launcher restarts.
+
+    Times are wall clock timestamps, since the monotonic clock restarts with
+    the system.
+    """
+
+    def __init__(self, file=None):
+        self._file = file
+        self._runs = {} if file is None else load_json(file)
+
+    def runs(self, key):
+        """Returns the recorded runs of a version, oldest first."""
+        return self._runs.get(key, [])
+
+    def record(self, key, ended, runtime, returncode):
+        """Records the exit of a version and saves the history.
+
+        Args:
+            key: Identifies the version, e.g. its path.
+            ended: Wall clock time of the exit.
+            runtime: Duration of the run in seconds.
+            returncode: Exit code of the run.
+        """
+        runs = self._runs.setdefault(key, [])
+        runs.append({'ended': ended, 'runtime': runtime, 'returncode': returncode})
+        del runs[:-HISTORY_LENGTH]
+        self._save()
+
+    def _save(self):
+        if self._file is not None:
+            save_json(self._file, self._runs, 'restart history')
+
+
+def crashes_in_window(runs, policy, now):
+    """Counts the crashes within the budget window.
+
+    >>> crashes_in_window([{'ended': 10, 'returncode': 1}, {'ended': 95, 'returncode': 1},
+    ...                    {'ended': 99, 'returncode': 0}], {'window': 10}, 100)
+    1
+    """
+    since = now - policy['window']
+    return sum(1 for run in runs if run['returncode'] == 1 and run['ended'] >= since)
+
+
+def budget_exhausted(runs, policy, now):
+    """Returns True if the version crashed too often recently and should not be restarted."""
+    return crashes_in_window(runs, policy, now) >= policy['budget']
+
+
+def budget_wait(runs, policy, now):
+    """Calculates how long until enough crashes leave the window to restart the version again.
+
+    >>> runs = [{'ended': 10, 'returncode': 1}, {'ended': 15, 'returncode': 1}, {'ended': 18, 'returncode': 1}]
+    >>> budget_wait(runs, {'window': 10, 'budget': 2}, 20)
+    5
+    >>> budget_wait(runs, {'window': 10, 'budget': 5}, 20)
+    0.0
+    """
+    since = now - policy['window']
+    crashes = [run['ended'] for run in runs if run['returncode'] == 1 and run['ended'] >= since]
+    excess = len(crashes) - policy['budget']
+    if excess < 0:
+        return 0.0
+
+    return crashes[excess] - since
+
+
+def backoff_delay(runs, policy, rnd=random):
+    """Calculates how long to wait before restarting a crashed version.
+
+    The delay grows exponentially with the number of consecutive crashes
+    that happened soon after start, with random jitter so that failures are
+    not retried in lockstep.
+
+    >>> policy = dict(DEFAULT_RESTART_POLICY, jitter=0)
+    >>> backoff_delay([{'runtime': 1, 'returncode': 1}] * 3, policy)
+    4.0
+    >>> backoff_delay([{'runtime': 100, 'returncode': 1}, {'runtime': 1, 'returncode': 1}], policy)
+    1.0
+    >>> backoff_delay([{'runtime': 1, 'returncode': 1}, {'runtime': 100, 'returncode': 1}], policy)
+    0.0
+    >>> backoff_delay([], policy)
+    0.0
+    """
+    consecutive = 0
+    for run in reversed(runs):
+        if run['returncode'] != 1 or run['runtime'] >= policy['stable_runtime']:
+            break
+        consecutive += 1
+
+    if consecutive == 0:
+        return 0.0
+
+    delay = min(policy['max_delay'], policy['initial_delay'] * policy['multiplier'] ** (consecutive - 1))
+    return delay * rnd.uniform(1 - policy['jitter'], 1 + policy['jitter'])
@@ -0,0 +1,159 @@
+import os
+import stat
+import time
+
+from json_file import load_json, save_json
+from trash import TRASH_DIR
+
+
+# number of known good versions kept installed
+DEFAULT_KEEP_VERSIONS = 3
+
+
+class LaunchHistory:
+    """When framework versions were last launched and last ran successfully.
+
+    A run is successful if it lasts long enough to be considered stable, or
+    if the framework exits normally. Times are wall clock timestamps.
+    """
+
+    def __init__(self, file=None):
+        self._file = file
+        self._versions = {} if file is None else load_json(file)
+
+    def launched(self, key, now):
+        self._versions.setdefault(key, {})['launched'] = now
+        self._save()
+
+    def succeeded(self, key, now):
+        self._versions.setdefault(key, {})['good'] = now
+        self._save()
+
+    def forget(self, key):
+        if self._versions.pop(key, None) is not None:
+            self._save()
+
+    def last_launch(self, key):
+        """Returns the time the version was last launched, or None."""
+        return self._versions.get(key, {}).get('launched')
+
+    def known_good(self, key):
+        return 'good' in self._versions.get(key, {})
+
+    def last_good(self):
+        """Returns the key of the version that ran successfully most recently, or None."""
+        good = [(record['good'], key) for key, record in self._versions.items() if 'good' in record]
+        return max(good)[1] if good else None
+
+    def _save(self):
+        if self._file is not None:
+            save_json(self._file, self._versions, 'launch history')
+
+
+def launch_recorder(launches, key, stable_runtime):
+    """Creates a Supervisor task that records the launch of a version.
+
+    The run is recorded as successful once it has lasted stable_runtime
+    seconds.
+    """
+    import asyncio
+
+    async def record(process):
+        launches.launched(key, time.time())
+        await asyncio.sleep(stable_runtime)
+        launches.succeeded(key, time.time())
+    return record
+
+
+def select_evictions(versions, launches, keep, quota=None, usage=0, sizes=None):
+    """Chooses the installed versions to remove.
+
+    The newest keep known good versions, the version that ran successfully
+    most recently, the newest version and the versions that are newer than
+    every launched version are retained, everything else is removed. If the
+    retained versions still use more space than the quota, they are removed
+    as well, least recently launched first, except for the last successful
+    and the newest version.
+
+    >>> launches = LaunchHistory()
+    >>> for key, launched in (('v4', 40), ('v3', 30), ('v2', 20), ('v1', 10)):
+    ...     launches.launched(key, launched)
+    >>> for key, succeeded in (('v3', 31), ('v2', 21), ('v1', 11)):
+    ...     launches.succeeded(key, succeeded)
+    >>> select_evictions(['v5', 'v4', 'v3', 'v2', 'v1'], launches, 1)
+    ['v1', 'v2', 'v4']
+    >>> select_evictions(['v4', 'v3', 'v2', 'v1'], launches, 1)
+    ['v1', 'v2']
+    >>> sizes = {'v5': 10, 'v4': 10, 'v3': 10, 'v2': 10, 'v1': 10}
+    >>> select_evictions(['v5', 'v4', 'v3', 'v2', 'v1'], launches, 3, quota=35, usage=50, sizes=sizes)
+    ['v4', 'v1']
+
+    Args:
+        versions: Keys of the installed versions, newest first.
+        launches: LaunchHistory of the versions.
+        keep: Number of known good versions to retain.
+        quota: Space the installed versions may use in bytes, or None.
+        usage: Space used by the installed versions.
+        sizes: Dict of the space freed by removing each version.
+
+    Returns:
+        List of keys to remove.
+    """
+    def lru(key):
+        return launches.last_launch(key) or 0
+
+    last_good = launches.last_good()
+    retained = set([key for key in versions if launches.known_good(key)][:keep])
+    retained.update(versions[:1])
+    if last_good in versions:
+        retained.add(last_good)
+    for key in versions:
+        if launches.last_launch(key) is not None:
+            break
+        # not launched yet, e.g. just installed
+        retained.add(key)
+
+    evicted = sorted((key for key in versions if key not in retained), key=lru)
+    if quota is None:
+        return evicted
+
+    usage -= sum(sizes[key] for key in evicted)
+    for key in sorted(retained, key=lru):
+        if usage <= quota:
+            break
+        if key in (last_good, versions[0]):
+            continue
+        evicted.append(key)
+        usage -= sizes[key]
+
+    return evicted
+
+
+def exclusive_size(directory):
+    """Estimates the space freed by removing a directory tree.
+
+    Files that are linked only into the tree and the object store are freed,
+    files with more links are shared with other versions.
+    """
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(directory):
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if not stat.S_ISREG(st.st_mode) or st.st_nlink <= 2:
+                size += st.st_blocks * 512
+    return size
+
+
+def disk_usage(install_directory):
+    """Returns the space used by an installation directory, excluding the trash."""
+    seen = set()
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(install_directory):
+        if dirpath == install_directory and TRASH_DIR in dirnames:
+            dirnames.remove(TRASH_DIR)
+        for name in filenames:
+            st = os.lstat(os.path.join(dirpath, name))
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                size += st.st_blocks * 512
+    return size
@@ -0,0 +1,177 @@
+import asyncio
+import codecs
+import collections
+import sys
+import time
+
+
+# number of output lines kept for diagnostics
+OUTPUT_BUFFER_LINES = 200
+
+# seconds to wait for the remaining output after the process exited
+OUTPUT_DRAIN_TIMEOUT = 1.0
+
+
+class ProcessResult(collections.namedtuple('ProcessResult', ['returncode', 'runtime', 'output'])):
+    """Outcome of a supervised process.
+
+    Attributes:
+        returncode: Exit code, negative if the process was killed by a signal.
+        runtime: Seconds between start and exit.
+        output: The last OUTPUT_BUFFER_LINES lines of stdout and stderr.
+    """
+    __slots__ = ()
+
+    @property
+    def signal(self):
+        """Number of the signal that killed the process, or None.
+
+        >>> ProcessResult(-9, 1.0, []).signal
+        9
+        >>> ProcessResult(1, 1.0, []).signal is None
+        True
+        """
+        return -self.returncode if self.returncode < 0 else None
+
+
+async def wait_for_exit(process, poll_interval=0.1):
+    """Waits until a process exits and returns its exit code.
+
+    Process.wait() may also wait for the output pipes to be closed, which
+    never happens if a process that inherited them keeps running.
+    """
+    waiter = asyncio.ensure_future(process.wait())
+    try:
+        while process.returncode is None and not waiter.done():
+            await asyncio.wait([waiter], timeout=poll_interval)
+    finally:
+        waiter.cancel()
+
+    return process.returncode
+
+
+class SupervisedProcess:
+    """A running child process.
+
+    Passed to the tasks that run alongside the process, see Supervisor.run.
+    """
+
+    def __init__(self, process, args):
+        self.process = process
+        self.args = args
+        self.started = time.monotonic()
+        self.output = collections.deque(maxlen=OUTPUT_BUFFER_LINES)
+        self.last_output = self.started
+
+    @property
+    def pid(self):
+        return self.process.pid
+
+    @property
+    def runtime(self):
+        return time.monotonic() - self.started
+
+    async def terminate(self, timeout=5.0):
+        """Asks the process to exit, kills it if it does not do so in time."""
+        if self.process.returncode is not None:
+            return
+
+        try:
+            self.process.terminate()
+            await asyncio.wait_for(wait_for_exit(self.process), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+
+
+class Supervisor:
+    """Runs child processes on an asyncio event loop.
+
+    Processes are executed directly, without a shell. Their output is
+    forwarded line by line to the launcher's stdout/stderr and kept in a
+    bounded buffer, lines longer than the buffer limit of the pipes in
+    pieces. Tasks passed to run() execute on the same loop while the child is
+    running, so the launcher can react to events without threads.
+    """
+
+    def __init__(self, stdout=None, stderr=None):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._stdout = stdout
+        self._stderr = stderr
+
+    async def _forward(self, stream, sink, supervised):
+        # characters may be split between the pieces of a long line
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        while True:
+            try:
+                line = await stream.readuntil(b'\n')
+            except asyncio.IncompleteReadError as e:
+                line = e.partial  # the end of the output, without a newline
+            except asyncio.LimitOverrunError as e:
+                # the line does not fit in the buffer of the stream, forward what's buffered and keep reading
+                line = await stream.read(e.consumed)
+            if not line:
+                break
+
+            line = decoder.decode(line)
+            supervised.output.append(line)
+            supervised.last_output = time.monotonic()
+            try:
+                sink.write(line)
+                sink.flush()
+            except (BrokenPipeError, ValueError):
+                pass
+
+    async def run_async(self, args, tasks=(), cwd=None, env=None):
+        """Coroutine version of run()."""
+        process = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE,
+                                                       stderr=asyncio.subprocess.PIPE, cwd=cwd, env=env)
+        supervised = SupervisedProcess(process, args)
+
+        readers = [
+            asyncio.ensure_future(self._forward(process.stdout, self._stdout or sys.stdout, supervised)),
+            asyncio.ensure_future(self._forward(process.stderr, self._stderr or sys.stderr, supervised))
+        ]
+        background = [asyncio.ensure_future(task(supervised)) for task in tasks]
+        try:
+            returncode = await wait_for_exit(process)
+            runtime = supervised.runtime
+            # read the remaining output, but don't wait for processes that inherited the pipes
+            await asyncio.wait(readers, timeout=OUTPUT_DRAIN_TIMEOUT)
+        except BaseException:
+            await supervised.terminate()
+            raise
+        finally:
+            for task in readers + background:
+                task.cancel()
+            if background:
+                await asyncio.wait(background)
+
+        return ProcessResult(returncode, runtime, list(supervised.output))
+
+    def run(self, args, tasks=(), cwd=None, env=None):
+        """Runs a process until it exits.
+
+        Args:
+            args: Program and arguments.
+            tasks: Functions that take the SupervisedProcess and return a
+                coroutine, e.g. to monitor or stop the process. They are
+                cancelled when the process exits.
+            cwd: Working directory of the process.
+            env: Environment of the process, defaults to the launcher's.
+
+        Returns:
+            A ProcessResult.
+
+        Raises:
+            OSError: The program could not be started.
+        """
+        return self._loop.run_until_complete(self.run_async(args, tasks, cwd, env))
+
+    def run_until_complete(self, coroutine):
+        return self._loop.run_until_complete(coroutine)
+
+    def close(self):
+        self._loop.close()
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+
+
+# directory in an installation directory that holds the trees waiting to be deleted
+TRASH_DIR = '.trash'
+
+# number of files deleted between pauses, and the length of a pause in seconds
+UNLINK_BATCH_SIZE = 200
+UNLINK_BATCH_PAUSE = 0.05
+
+
+def trash_directory(install_directory):
+    """Returns the trash directory of an installation directory.
+
+    The trash must be on the same filesystem as the installed versions so
+    that they can be moved into it by renaming.
+    """
+    return os.path.join(install_directory, TRASH_DIR)
+
+
+def move_to_trash(path, trash_dir):
+    """Removes a directory tree from its place, without deleting its contents yet.
+
+    The tree is renamed into the trash, which takes the same short time
+    regardless of the size of the tree. If the tree can't be renamed, it is
+    deleted right away.
+
+    Args:
+        path: Directory tree to remove.
+        trash_dir: Trash directory, see trash_directory.
+    """
+    import shutil
+    import tempfile
+
+    name = os.path.basename(os.path.normpath(path))
+    try:
+        os.makedirs(trash_dir, exist_ok=True)
+        # trees with the same name may be deleted multiple times
+        holder = tempfile.mkdtemp(prefix=name + '-', dir=trash_dir)
+        os.rename(path, os.path.join(holder, name))
+    except FileNotFoundError:
+        pass
+    except OSError:
+        print('Failed to move {} to trash, deleting it'.format(path))
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def trash_is_empty(trash_dir):
+    try:
+        return not os.listdir(trash_dir)
+    except FileNotFoundError:
+        return True
+
+
+def _delete(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        os.rmdir(path)
+    else:
+        os.unlink(path)
+
+
+def empty_trash(trash_dir, batch_size=UNLINK_BATCH_SIZE, pause=UNLINK_BATCH_PAUSE, sleep=time.sleep):
+    """Deletes the contents of the trash directory.
+
+    Files are deleted in batches with a pause after each batch, so that the
+    storage is not kept busy for a long time. Deletion can be interrupted
+    at any time, the rest is deleted by the next call.
+
+    Args:
+        trash_dir: Trash directory, see trash_directory.
+        batch_size: Number of files and directories deleted between pauses.
+        pause: Length of a pause in seconds.
+        sleep: Function used to pause.
+
+    Returns:
+        Number of files and directories deleted.
+    """
+    deleted = 0
+    for dirpath, dirnames, filenames in os.walk(trash_dir, topdown=False):
+        for name in filenames + dirnames:
+            path = os.path.join(dirpath, name)
+            try:
+                _delete(path)
+            except FileNotFoundError:
+                continue  # deleted by another run
+            except PermissionError:
+                # the tree may contain read only directories
+                os.chmod(dirpath, 0o700)
+                _delete(path)
+
+            deleted += 1
+            if deleted % batch_size == 0:
+                sleep(pause)
+
+    return deleted
+
+
+class TrashReclaimer:
+    """Empties the trash of an installation directory in a low priority process.
+
+    Unused objects of the object store are removed after the trash is empty,
+    since they may have been linked into the deleted trees.
+    """
+
+    def __init__(self, install_directory):
+        self._install_directory = install_directory
+        self._process = None
+
+    def start(self):
+        """Starts emptying the trash, unless it is empty or being emptied already."""
+        if self.running or trash_is_empty(trash_directory(self._install_directory)):
+            return
+
+        import shutil
+        import subprocess
+        from background_install import LOW_PRIORITY_PREFIXES
+
+        command = [sys.executable, os.path.abspath(__file__), self._install_directory]
+        for prefix in LOW_PRIORITY_PREFIXES:
+            if shutil.which(prefix[0]):
+                command = prefix + command
+
+        print('Emptying {} in the background'.format(trash_directory(self._install_directory)))
+        self._process = subprocess.Popen(command)
+
+    @property
+    def running(self):
+        return self._process is not None and self._process.poll() is None
+
+
+if __name__ == "__main__":
+    from object_store import collect_garbage, store_directory
+
+    print('Deleted {} files'.format(empty_trash(trash_directory(sys.argv[1]))))
+    print('Removed {} bytes of unused objects'.format(collect_garbage(store_directory(sys.argv[1]))))
@@ -0,0 +1,178 @@
+import os
+import tarfile
+
+from package_digest import cached_digest, new_hash, record_digest
+from trash import move_to_trash, trash_directory
+
+
+# size of the blocks read from the update package, also used as tarfile buffer size
+CHUNK_SIZE = 64 * 1024
+
+# members are checked by _checked_member, which applies the 'data' filter where tarfile has it
+EXTRACT_FILTER = {'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}
+
+
+class VerificationError(Exception):
+    pass
+
+
+class HashingReader:
+    """Read-only file wrapper that feeds every byte read through a digest.
+
+    Lets the update package be hashed, decompressed and extracted while it is
+    read from the storage only once. Without hash_fn, only the length is
+    counted.
+    """
+
+    def __init__(self, fileobj, hash_fn):
+        self._file = fileobj
+        self._hash_fn = hash_fn
+        self.length = 0
+
+    def read(self, size=-1):
+        data = self._file.read(size)
+        if self._hash_fn is not None:
+            self._hash_fn.update(data)
+        self.length += len(data)
+        return data
+
+    def drain(self, chunk_size=CHUNK_SIZE):
+        """Reads the rest of the file, e.g. padding after the end of the archive."""
+        while self.read(chunk_size):
+            pass
+
+    def hexdigest(self):
+        return self._hash_fn.hexdigest() if self._hash_fn is not None else None
+
+
+def _open_package(package_file, expected_digest, algorithm):
+    """Opens the update package for extraction.
+
+    Hashing is skipped if the package has been verified already, and did not
+    change since, see package_digest.record_digest.
+
+    Returns:
+        The open file and a HashingReader of it.
+    """
+    f = open(package_file, 'rb')
+    st = os.fstat(f.fileno())
+    if expected_digest is not None and cached_digest(package_file, algorithm, st) == expected_digest:
+        return f, HashingReader(f, None)
+    return f, HashingReader(f, new_hash(algorithm))
+
+
+def _check_package(package_file, reader, expected_length, expected_digest, algorithm):
+    if reader.length != expected_length:
+        raise VerificationError('Update file length mismatch')
+
+    digest = reader.hexdigest()
+    if digest is None:
+        return  # verified before
+
+    if expected_digest is None or digest != expected_digest:
+        raise VerificationError('Update file hash mismatch')
+
+    record_digest(package_file, algorithm, digest)
+
+
+def is_within_directory(directory, target):
+    """Checks if target path is inside directory.
+
+    >>> is_within_directory('/tmp/foo', '/tmp/foo/bar')
+    True
+    >>> is_within_directory('/tmp/foo', '/tmp/foo/../bar')
+    False
+    >>> is_within_directory('/tmp/foo', '/tmp/foobar')
+    False
+    """
+    abs_directory = os.path.abspath(directory)
+    abs_target = os.path.abspath(target)
+
+    return os.path.commonpath([abs_directory, abs_target]) == abs_directory
+
+
+def _checked_member(destination, member):
+    """Checks that extracting a member can't write outside destination.
+
+    Besides the name of the member, the directories it is extracted into are
+    resolved, so that nothing is written through a symbolic link, and the
+    target of symbolic and hard links must resolve inside destination too.
+    Where tarfile supports it, its 'data' filter is applied as well.
+
+    Returns:
+        The, possibly filtered, member and the path it is extracted to.
+
+    Raises:
+        VerificationError: The member would be extracted outside destination.
+    """
+    if hasattr(tarfile, 'data_filter'):
+        try:
+            member = tarfile.data_filter(member, destination)
+        except tarfile.FilterError as e:
+            raise VerificationError('Unsafe member in Tar File: {}'.format(e))
+
+    root = os.path.realpath(destination)
+    member_path = os.path.join(destination, member.name)
+    if not is_within_directory(destination, member_path) or \
+            not is_within_directory(root, os.path.realpath(member_path)):
+        raise VerificationError('Attempted Path Traversal in Tar File')
+
+    if member.issym():
+        target = os.path.join(os.path.dirname(member_path), member.linkname)
+    elif member.islnk():
+        target = os.path.join(destination, member.linkname)
+    else:
+        return member, member_path
+
+    if not is_within_directory(root, os.path.realpath(target)):
+        raise VerificationError('Attempted Link Traversal in Tar File')
+    return member, member_path
+
+
+def extract_verified(package_file, expected_length, expected_digest, destination, algorithm='md5'):
+    """Verifies and extracts an update package in a single streaming pass.
+
+    The package is read in CHUNK_SIZE blocks. Each block updates the digest
+    and is handed to the decompressor, members are extracted one by one as
+    they are encountered, after checking that they and their link targets
+    stay inside destination, see _checked_member. Length and digest are
+    checked after the whole file has been read, and the verified digest is
+    recorded, so that the package is not hashed again. If anything fails,
+    destination is moved to the trash of its parent directory.
+
+    Args:
+        package_file: Path to the gzipped tar update package.
+        expected_length: Size of the package in bytes, from the metadata.
+        expected_digest: Hex digest of the package, from the metadata.
+        destination: Directory to extract the package into.
+        algorithm: Hash algorithm of expected_digest.
+
+    Raises:
+        VerificationError: The package does not match the metadata or
+            contains a member that would be extracted outside destination.
+        tarfile.TarError, ValueError: The package is not a valid archive.
+        IOError: An error occurred during reading the package.
+    """
+    directories = []
+    try:
+        f, reader = _open_package(package_file, expected_digest, algorithm)
+        with f:
+            with tarfile.open(fileobj=reader, mode='r|gz', bufsize=CHUNK_SIZE) as tar:
+                for member in tar:
+                    member, member_path = _checked_member(destination, member)
+
+                    if member.isdir():
+                        # restore permissions at the end, a read-only directory would prevent extracting its contents
+                        directories.append((member_path, member.mode))
+                        tar.extract(member, destination, set_attrs=False, **EXTRACT_FILTER)
+                    else:
+                        tar.extract(member, destination, **EXTRACT_FILTER)
+            reader.drain()
+
+        _check_package(package_file, reader, expected_length, expected_digest, algorithm)
+
+        for path, mode in reversed(directories):
+            os.chmod(path, mode)
+    except BaseException:
+        move_to_trash(destination, trash_directory(os.path.dirname(destination)))
+        raise
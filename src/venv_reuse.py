@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+
+from package_digest import hash_file
+
+
+# written into the virtualenv once its dependencies are installed successfully
+FINGERPRINT_FILE = 'revvy-fingerprint.json'
+
+
+def venv_fingerprint(install_dir):
+    """Describes the dependencies a virtualenv is built from.
+
+    Args:
+        install_dir: The 'install' directory of a framework version, containing
+            requirements.txt and the wheels in 'packages'.
+
+    Returns:
+        A dict with the md5 hash of requirements.txt and of every wheel, by
+        file name.
+    """
+    packages_dir = os.path.join(install_dir, 'packages')
+    try:
+        wheel_names = os.listdir(packages_dir)
+    except FileNotFoundError:
+        wheel_names = []
+
+    return {
+        'requirements': hash_file(os.path.join(install_dir, 'requirements.txt'), 'md5', cache=False),
+        'wheels': {name: hash_file(os.path.join(packages_dir, name), 'md5', cache=False)
+                   for name in sorted(wheel_names)}
+    }
+
+
+def read_fingerprint(venv_dir):
+    """Returns the fingerprint of a completely set up virtualenv or None."""
+    try:
+        with open(os.path.join(venv_dir, FINGERPRINT_FILE), 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def write_fingerprint(venv_dir, fingerprint):
+    """Marks a virtualenv as completely set up from the given dependencies.
+
+    The file is replaced instead of overwritten, it may be a hard link shared
+    with the virtualenv it was cloned from.
+    """
+    path = os.path.join(venv_dir, FINGERPRINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(fingerprint, f)
+    os.replace(path + '.tmp', path)
+
+
+def changed_wheels(old, new):
+    """Lists the wheels of the new fingerprint that are not part of the old one.
+
+    >>> changed_wheels({'wheels': {'a.whl': '1', 'b.whl': '2'}}, {'wheels': {'a.whl': '1', 'b.whl': '3', 'c.whl': '4'}})
+    ['b.whl', 'c.whl']
+    """
+    return sorted(name for name, digest in new['wheels'].items() if old['wheels'].get(name) != digest)
+
+
+def find_reusable_venv(install_directory, fingerprint, exclude):
+    """Looks for the installed virtualenv that is the closest match to a fingerprint.
+
+    Args:
+        install_directory: Directory path with the fw installations.
+        fingerprint: Fingerprint of the virtualenv to be created.
+        exclude: Path of the version being installed.
+
+    Returns:
+        A tuple of the virtualenv path and its fingerprint, or (None, None) if
+        no installed virtualenv shares any wheels with the fingerprint. An
+        identical fingerprint is preferred, otherwise the one with the fewest
+        changed wheels is returned.
+    """
+    best = (None, None)
+    best_changes = len(fingerprint['wheels'])
+    for fw_dir in os.listdir(install_directory):
+        fw_dir = os.path.join(install_directory, fw_dir)
+        if fw_dir == exclude or not os.path.isfile(os.path.join(fw_dir, 'installed')):
+            continue
+
+        venv_dir = os.path.join(fw_dir, 'install', 'venv')
+        candidate = read_fingerprint(venv_dir)
+        if candidate is None:
+            continue
+
+        if candidate == fingerprint:
+            return venv_dir, candidate
+
+        changes = len(changed_wheels(candidate, fingerprint))
+        if changes < best_changes:
+            best = (venv_dir, candidate)
+            best_changes = changes
+
+    return best
+
+
+def clone_venv(source, destination):
+    """Copies a virtualenv to a new location.
+
+    Files are hard linked where possible, only the scripts that contain the
+    absolute path of the virtualenv are rewritten. Rewritten files are
+    replaced, not modified in place, so the source virtualenv is unaffected.
+
+    Args:
+        source: Path of the existing virtualenv.
+        destination: Path of the new virtualenv, must not exist.
+    """
+    def link_or_copy(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    shutil.copytree(source, destination, symlinks=True, copy_function=link_or_copy)
+
+    # the clone is not set up until its own fingerprint is written
+    fingerprint_file = os.path.join(destination, FINGERPRINT_FILE)
+    if os.path.isfile(fingerprint_file):
+        os.unlink(fingerprint_file)
+
+    old_path = os.path.abspath(source).encode('utf-8')
+    new_path = os.path.abspath(destination).encode('utf-8')
+
+    bin_dir = os.path.join(destination, 'bin')
+    candidates = [os.path.join(bin_dir, name) for name in os.listdir(bin_dir)]
+    candidates.append(os.path.join(destination, 'pyvenv.cfg'))
+
+    for path in candidates:
+        if os.path.islink(path) or not os.path.isfile(path):
+            continue
+
+        with open(path, 'rb') as f:
+            contents = f.read()
+
+        if old_path in contents:
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(contents.replace(old_path, new_path))
+            shutil.copymode(path, tmp_path)
+            os.replace(tmp_path, path)
@@ -0,0 +1,139 @@
+import json
+import os
+
+from version import Version
+
+
+INDEX_FORMAT = 1
+
+
+def index_file(directory):
+    """Returns the path of the index of an installation directory.
+
+    The index is kept next to the directory, not inside it, so that writing
+    the index does not change the modification time of the directory.
+
+    >>> index_file('user/packages/')
+    'user/packages.index.json'
+    """
+    return os.path.normpath(directory) + '.index.json'
+
+
+def scan_directory(directory, read_version):
+    """Builds the index of an installation directory by reading every manifest.
+
+    Args:
+        directory: Base directory of installed frameworks.
+        read_version: Function that reads the Version from a manifest file, or
+            returns None.
+
+    Returns:
+        The index as a dict. Entries are sorted by version, newest first.
+    """
+    dir_stat = os.stat(directory)
+    entries = []
+    for fw_dir in os.listdir(directory):
+        fw_path = os.path.join(directory, fw_dir)
+        manifest_file = os.path.join(fw_path, 'manifest.json')
+        if not os.path.isfile(manifest_file):
+            continue
+
+        version = read_version(manifest_file)
+        if version is None:
+            continue
+
+        manifest_stat = os.stat(manifest_file)
+        entries.append({
+            'path': fw_dir,
+            'version': str(version),
+            'installed': os.path.isfile(os.path.join(fw_path, 'installed')),
+            'manifest_mtime': manifest_stat.st_mtime_ns,
+            'manifest_size': manifest_stat.st_size
+        })
+
+    entries.sort(key=lambda entry: Version(entry['version']), reverse=True)
+
+    return {'format': INDEX_FORMAT, 'mtime': dir_stat.st_mtime_ns, 'entries': entries}
+
+
+def load_index(directory):
+    """Reads the index of an installation directory.
+
+    Returns:
+        The index or None if it is missing, corrupted or the directory has
+        been modified since the index was written.
+    """
+    try:
+        with open(index_file(directory), 'r') as f:
+            index = json.load(f)
+        if index['format'] != INDEX_FORMAT or index['mtime'] != os.stat(directory).st_mtime_ns:
+            return None
+        return index
+    except (IOError, ValueError, KeyError, TypeError):
+        return None
+
+
+def write_index(directory, index):
+    """Atomically replaces the index of an installation directory.
+
+    Raises:
+        IOError: The index could not be written, e.g. read-only filesystem.
+    """
+    path = index_file(directory)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(index, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def update_index(directory, read_version):
+    """Rescans an installation directory and stores its index.
+
+    Call this after any change to the installed versions.
+
+    Returns:
+        The new index. It is returned even if it could not be stored.
+    """
+    index = scan_directory(directory, read_version)
+    try:
+        write_index(directory, index)
+    except IOError:
+        print('Failed to write version index of {}'.format(directory))
+    return index
+
+
+def entry_is_current(directory, entry):
+    """Checks that an index entry still matches the manifest on the disk."""
+    try:
+        manifest_stat = os.stat(os.path.join(directory, entry['path'], 'manifest.json'))
+    except FileNotFoundError:
+        return False
+
+    return manifest_stat.st_mtime_ns == entry['manifest_mtime'] and manifest_stat.st_size == entry['manifest_size']
+
+
+def newest_entry(index, directory, skipped_versions, installed_only=False):
+    """Returns the newest index entry that is not skipped, or None.
+
+    Args:
+        index: Index of directory.
+        directory: Base directory of installed frameworks.
+        skipped_versions: List of path names of framework versions to be
+            skipped.
+        installed_only: Skip versions that are still being installed, e.g.
+            by the background installer, or whose installation was
+            interrupted.
+    """
+    for entry in index['entries']:
+        path = os.path.join(directory, entry['path'])
+        if path in skipped_versions:
+            continue
+
+        # finishing an installation doesn't modify the directory, so the index may be outdated
+        if installed_only and not entry['installed'] and not os.path.isfile(os.path.join(path, 'installed')):
+            continue
+
+        return entry
+
+    return None
@@ -0,0 +1,516 @@
+import base64
+import concurrent.futures
+import csv
+import hashlib
+import os
+import re
+import shutil
+import sys
+import sysconfig
+import zipfile
+
+from update_package import is_within_directory
+
+
+# number of wheels unpacked at the same time
+WHEEL_INSTALLERS = 4
+
+# written into the INSTALLER file of installed distributions
+INSTALLER_NAME = 'revvy-launcher'
+
+# requirement lines that pin a single version, e.g. 'pyserial==3.4'
+_PIN = re.compile(r'^([A-Za-z0-9][A-Za-z0-9._-]*)\s*==\s*([A-Za-z0-9.+!_-]+)$')
+
+# glibc versions of the legacy manylinux tags
+_MANYLINUX_GLIBC = {'manylinux1': (2, 5), 'manylinux2010': (2, 12), 'manylinux2014': (2, 17)}
+
+_SCRIPT_TEMPLATE = '''#!{python}
+# -*- coding: utf-8 -*-
+import sys
+from {module} import {name}
+if __name__ == '__main__':
+    sys.exit({function}())
+'''
+
+
+class UnsupportedWheel(Exception):
+    """The wheel or requirement can't be installed without pip."""
+    pass
+
+
+def normalize_name(name):
+    """Normalizes a project name, see PEP 503.
+
+    >>> normalize_name('Revvy_Utils.Core')
+    'revvy-utils-core'
+    """
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def parse_wheel_name(file_name):
+    """Splits the file name of a wheel into its parts, see PEP 427.
+
+    >>> parse_wheel_name('pyserial-3.4-py2.py3-none-any.whl')
+    ('pyserial', '3.4', ['py2', 'py3'], ['none'], ['any'])
+    >>> parse_wheel_name('pyserial-3.4.tar.gz') is None
+    True
+
+    Returns:
+        A tuple of the normalized project name, version and the lists of
+        python, abi and platform tags, or None if the file is not a wheel.
+    """
+    if not file_name.endswith('.whl'):
+        return None
+    parts = file_name[:-len('.whl')].split('-')
+    if len(parts) not in (5, 6):
+        return None
+    name, version, python_tags, abi_tags, platform_tags = parts[0], parts[1], parts[-3], parts[-2], parts[-1]
+    return normalize_name(name), version, python_tags.split('.'), abi_tags.split('.'), platform_tags.split('.')
+
+
+def _glibc_version():
+    try:
+        name, version = os.confstr('CS_GNU_LIBC_VERSION').split()
+        return tuple(int(part) for part in version.split('.')[:2])
+    except (AttributeError, ValueError, OSError):
+        return None  # not glibc
+
+
+def _platform_supported(tag, platform, glibc):
+    if tag in ('any', platform):
+        return True
+    if glibc is None or not platform.startswith('linux_'):
+        return False
+
+    arch = platform[len('linux_'):]
+    match = re.match(r'^manylinux_(\d+)_(\d+)_(.+)$', tag)
+    if match:
+        required, tag_arch = (int(match.group(1)), int(match.group(2))), match.group(3)
+    else:
+        legacy, _, tag_arch = tag.partition('_')
+        if legacy not in _MANYLINUX_GLIBC:
+            return False
+        required = _MANYLINUX_GLIBC[legacy]
+    return tag_arch == arch and required <= glibc
+
+
+def wheel_supported(python_tags, abi_tags, platform_tags, version_info=sys.version_info, abiflags=sys.abiflags,
+                    platform=None, glibc=None):
+    """Checks if a wheel can be installed for the running interpreter.
+
+    >>> wheel_supported(['py2', 'py3'], ['none'], ['any'], (3, 7), 'm')
+    True
+    >>> wheel_supported(['cp37'], ['cp37m'], ['linux_armv7l'], (3, 7), 'm', 'linux_armv7l')
+    True
+    >>> wheel_supported(['cp35'], ['abi3'], ['linux_armv7l'], (3, 7), 'm', 'linux_armv7l')
+    True
+    >>> wheel_supported(['cp38'], ['cp38'], ['linux_armv7l'], (3, 7), 'm', 'linux_armv7l')
+    False
+    >>> wheel_supported(['cp37'], ['cp37m'], ['manylinux2014_x86_64'], (3, 7), 'm', 'linux_x86_64', (2, 28))
+    True
+    """
+    if platform is None:
+        platform = sysconfig.get_platform().replace('-', '_').replace('.', '_')
+        glibc = _glibc_version()
+
+    major, minor = version_info[0], version_info[1]
+    cpython = 'cp{}{}'.format(major, minor)
+    pythons = {'py{}'.format(major), 'py{}{}'.format(major, minor), cpython}
+    abis = {'none', cpython + abiflags}
+
+    for python_tag in python_tags:
+        for abi_tag in abi_tags:
+            if abi_tag == 'abi3':
+                # stable abi, built for the same or an older python 3
+                match = re.match(r'^cp3(\d+)$', python_tag)
+                compatible = major == 3 and match is not None and int(match.group(1)) <= minor
+            else:
+                compatible = python_tag in pythons and abi_tag in abis
+            if compatible and any(_platform_supported(p, platform, glibc) for p in platform_tags):
+                return True
+    return False
+
+
+def python_supported(specifier, version_info=sys.version_info):
+    """Evaluates the Requires-Python metadata of a distribution.
+
+    >>> python_supported('>=3.5, !=3.6.*', (3, 7, 3))
+    True
+    >>> python_supported('>=3.8', (3, 7, 3))
+    False
+
+    Raises:
+        UnsupportedWheel: The specifier can't be evaluated.
+    """
+    current = tuple(version_info[:3])
+    for clause in specifier.split(','):
+        clause = clause.strip()
+        if not clause:
+            continue
+        match = re.match(r'^(~=|===|==|!=|<=|>=|<|>)\s*([0-9]+(?:\.[0-9]+)*)(\.\*)?$', clause)
+        if match is None or match.group(1) in ('~=', '==='):
+            raise UnsupportedWheel('Unsupported Requires-Python: {}'.format(specifier))
+
+        operator, wildcard = match.group(1), match.group(3) is not None
+        version = tuple(int(part) for part in match.group(2).split('.'))
+        if wildcard or operator in ('==', '!='):
+            # compare the released parts only, 3.7 matches 3.7.3 with a wildcard
+            equal = current[:len(version)] == version if wildcard else current == (version + (0, 0))[:3]
+            if equal != (operator == '=='):
+                return False
+            continue
+
+        version = (version + (0, 0))[:3]
+        if not {'<': current < version, '<=': current <= version,
+                '>': current > version, '>=': current >= version}[operator]:
+            return False
+    return True
+
+
+def parse_requirements(requirements_file):
+    """Reads the requirements of a framework version.
+
+    Args:
+        requirements_file: Path of requirements.txt.
+
+    Returns:
+        A tuple of the dict of the pinned versions by normalized project
+        name, and the list of other requirements, that are left to pip.
+
+    Raises:
+        UnsupportedWheel: The file contains pip options.
+        IOError: The file can't be read.
+    """
+    pins = {}
+    others = []
+    with open(requirements_file, 'r') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            if line.startswith('-') or ' -' in line:
+                raise UnsupportedWheel('Requirement options are not supported: {}'.format(line))
+
+            match = _PIN.match(line)
+            if match:
+                pins[normalize_name(match.group(1))] = match.group(2)
+            else:
+                others.append(line)
+    return pins, others
+
+
+def venv_site_packages(venv_dir):
+    """Returns the site-packages directory of a virtualenv created by the running interpreter.
+
+    Raises:
+        UnsupportedWheel: The virtualenv belongs to another python version.
+    """
+    version = None
+    try:
+        with open(os.path.join(venv_dir, 'pyvenv.cfg'), 'r') as f:
+            for line in f:
+                key, _, value = line.partition('=')
+                if key.strip() in ('version', 'version_info'):
+                    version = tuple(int(part) for part in value.strip().split('.')[:2])
+    except (IOError, ValueError):
+        pass
+
+    if version != tuple(sys.version_info[:2]):
+        raise UnsupportedWheel('The virtualenv is not created by python {}.{}'.format(*sys.version_info[:2]))
+
+    return os.path.join(venv_dir, 'lib', 'python{}.{}'.format(*version), 'site-packages')
+
+
+def installed_distributions(site_packages):
+    """Lists the completely installed distributions.
+
+    Returns:
+        A dict of the version and dist-info directory by normalized project
+        name.
+    """
+    distributions = {}
+    try:
+        names = os.listdir(site_packages)
+    except FileNotFoundError:
+        return distributions
+
+    for name in names:
+        if name.endswith('.dist-info') and os.path.isfile(os.path.join(site_packages, name, 'RECORD')):
+            project, _, version = name[:-len('.dist-info')].rpartition('-')
+            distributions[normalize_name(project)] = (version, os.path.join(site_packages, name))
+    return distributions
+
+
+def uninstall(venv_dir, site_packages, dist_info):
+    """Removes the files of an installed distribution, listed in its RECORD.
+
+    Files are unlinked, so a virtualenv that shares them through hard links
+    is not affected.
+    """
+    with open(os.path.join(dist_info, 'RECORD'), 'r', newline='') as f:
+        paths = [row[0] for row in csv.reader(f) if row]
+
+    directories = set()
+    for path in paths:
+        path = os.path.normpath(os.path.join(site_packages, path))
+        if not is_within_directory(venv_dir, path):
+            continue
+        for file in [path] + _compiled_files(path):
+            if os.path.lexists(file):
+                os.unlink(file)
+        directories.add(os.path.dirname(path))
+
+    shutil.rmtree(dist_info, ignore_errors=True)
+
+    # remove the directories that became empty, deepest first
+    for directory in sorted(directories, key=len, reverse=True):
+        for path in (os.path.join(directory, '__pycache__'), directory):
+            if path != site_packages and is_within_directory(site_packages, path):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+
+
+def uninstall_dropped(old_requirements_file, requirements_file, venv_dir):
+    """Removes the distributions that are pinned by the old requirements but not by the new ones.
+
+    Used on a virtualenv cloned from another framework version, which still
+    has the dependencies the new version dropped.
+
+    Returns:
+        The normalized names of the removed distributions.
+
+    Raises:
+        UnsupportedWheel: The virtualenv belongs to another python version.
+        IOError: The requirements can't be read.
+    """
+    old_pins, _ = parse_requirements(old_requirements_file)
+    pins, _ = parse_requirements(requirements_file)
+    site_packages = venv_site_packages(venv_dir)
+    installed = installed_distributions(site_packages)
+
+    dropped = sorted(name for name in old_pins if name not in pins and name in installed)
+    for name in dropped:
+        print('Removing {} {}'.format(name, installed[name][0]))
+        uninstall(venv_dir, site_packages, installed[name][1])
+    return dropped
+
+
+def _compiled_files(path):
+    if not path.endswith('.py'):
+        return []
+    cache_dir = os.path.join(os.path.dirname(path), '__pycache__')
+    prefix = os.path.basename(path)[:-len('.py')] + '.'
+    try:
+        return [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.startswith(prefix)]
+    except FileNotFoundError:
+        return []
+
+
+def _record_hash(data):
+    digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode('ascii')
+    return 'sha256=' + digest
+
+
+def _write_file(path, data, executable=False):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.lexists(path):
+        os.unlink(path)  # may be a hard link into a cloned virtualenv
+    with open(path, 'wb') as f:
+        f.write(data)
+    if executable:
+        os.chmod(path, 0o755)
+
+
+def _entry_point_scripts(entry_points, python):
+    """Generates the console and gui scripts of a distribution.
+
+    >>> scripts = _entry_point_scripts('[console_scripts]\\nrevvy = revvy.cli:main [extra]\\n', '/venv/bin/python3')
+    >>> print(scripts['revvy'])
+    #!/venv/bin/python3
+    # -*- coding: utf-8 -*-
+    import sys
+    from revvy.cli import main
+    if __name__ == '__main__':
+        sys.exit(main())
+    <BLANKLINE>
+    """
+    scripts = {}
+    section = None
+    for line in entry_points.splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', ';')):
+            continue
+        if line.startswith('['):
+            section = line.strip('[]').strip()
+            continue
+        if section not in ('console_scripts', 'gui_scripts'):
+            continue
+
+        name, _, target = line.partition('=')
+        target = target.split('[', 1)[0].strip()
+        module, _, function = target.partition(':')
+        if not module or not function:
+            raise UnsupportedWheel('Invalid entry point: {}'.format(line))
+        scripts[name.strip()] = _SCRIPT_TEMPLATE.format(python=python, module=module.strip(),
+                                                        name=function.split('.')[0].strip(), function=function.strip())
+    return scripts
+
+
+def install_wheel(wheel_file, venv_dir, site_packages):
+    """Unpacks a wheel into a virtualenv, like pip would.
+
+    Files are placed according to the wheel's data directory, scripts get the
+    interpreter of the virtualenv, entry point scripts are generated, and
+    INSTALLER and RECORD are written into the dist-info directory. RECORD is
+    written last, so that an interrupted installation is not considered
+    installed.
+
+    Raises:
+        UnsupportedWheel: The wheel uses features that are left to pip.
+        zipfile.BadZipFile: The wheel is not a valid archive.
+        IOError: An error occurred during reading or writing the files.
+    """
+    python = os.path.join(venv_dir, 'bin', 'python3')
+    bin_dir = os.path.join(venv_dir, 'bin')
+    targets = {
+        'purelib': site_packages,
+        'platlib': site_packages,
+        'scripts': bin_dir,
+        'data': venv_dir
+    }
+    record = []
+
+    def install_file(path, data, executable=False):
+        if not is_within_directory(venv_dir, path):
+            raise UnsupportedWheel('Attempted path traversal in {}'.format(wheel_file))
+        _write_file(path, data, executable)
+        record.append((os.path.relpath(path, site_packages), _record_hash(data), str(len(data))))
+
+    with zipfile.ZipFile(wheel_file) as wheel:
+        names = wheel.namelist()
+        dist_infos = {name.split('/', 1)[0] for name in names if name.split('/', 1)[0].endswith('.dist-info')}
+        if len(dist_infos) != 1:
+            raise UnsupportedWheel('{} has {} dist-info directories'.format(wheel_file, len(dist_infos)))
+        dist_info = dist_infos.pop()
+        data_dir = dist_info[:-len('.dist-info')] + '.data'
+
+        metadata = wheel.read(dist_info + '/WHEEL').decode('utf-8')
+        if not re.search(r'^Wheel-Version:\s*1\.', metadata, re.MULTILINE):
+            raise UnsupportedWheel('Unsupported wheel version of {}'.format(wheel_file))
+
+        metadata = wheel.read(dist_info + '/METADATA').decode('utf-8')
+        requires_python = re.search(r'^Requires-Python:(.*)$', metadata, re.MULTILINE)
+        if requires_python and not python_supported(requires_python.group(1)):
+            raise UnsupportedWheel('{} requires python {}'.format(wheel_file, requires_python.group(1).strip()))
+
+        dist_info_files = []
+        for info in wheel.infolist():
+            name = info.filename
+            if name.endswith('/'):
+                continue
+            if name.startswith(dist_info + '/'):
+                if name not in (dist_info + '/RECORD', dist_info + '/INSTALLER'):
+                    dist_info_files.append(info)
+                continue
+
+            executable = bool((info.external_attr >> 16) & 0o111)
+            if name.startswith(data_dir + '/'):
+                _, scheme, path = name.split('/', 2)
+                if scheme not in targets:
+                    raise UnsupportedWheel('{} installs {} files'.format(wheel_file, scheme))
+                data = wheel.read(info)
+                if scheme == 'scripts':
+                    if data.startswith((b'#!python', b'#!pythonw')):
+                        data = b'#!' + python.encode('utf-8') + data[data.index(b'\n'):]
+                    executable = True
+                install_file(os.path.join(targets[scheme], path), data, executable)
+            else:
+                install_file(os.path.join(site_packages, name), wheel.read(info), executable)
+
+        try:
+            entry_points = wheel.read(dist_info + '/entry_points.txt').decode('utf-8')
+        except KeyError:
+            entry_points = ''
+        for name, script in sorted(_entry_point_scripts(entry_points, python).items()):
+            install_file(os.path.join(bin_dir, name), script.encode('utf-8'), executable=True)
+
+        for info in dist_info_files:
+            install_file(os.path.join(site_packages, info.filename), wheel.read(info))
+
+    install_file(os.path.join(site_packages, dist_info, 'INSTALLER'), (INSTALLER_NAME + '\n').encode('utf-8'))
+
+    record_file = os.path.join(site_packages, dist_info, 'RECORD')
+    with open(record_file + '.tmp', 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerows(record)
+        writer.writerow((os.path.join(dist_info, 'RECORD'), '', ''))
+    os.replace(record_file + '.tmp', record_file)
+
+
+def install_wheels(requirements_file, packages_dir, venv_dir, reinstall=(), installers=WHEEL_INSTALLERS):
+    """Installs the pinned requirements of a framework version from its wheels.
+
+    Pinned requirements that are installed already in the same version are
+    skipped. Every other pin needs a compatible wheel in packages_dir, the
+    previously installed version is removed and the wheels are unpacked in
+    parallel. The pinned set is expected to be complete, dependencies of
+    the wheels are not resolved.
+
+    Args:
+        requirements_file: Path of requirements.txt.
+        packages_dir: Directory of the wheels.
+        venv_dir: The virtualenv to install into.
+        reinstall: File names of wheels that are installed even if their
+            version is installed already, e.g. because they were rebuilt.
+        installers: Number of wheels unpacked at the same time.
+
+    Returns:
+        A tuple of the requirements and of the wheel file names left to pip,
+        e.g. source packages, or wheels that failed to install.
+
+    Raises:
+        UnsupportedWheel: Nothing can be installed without pip.
+        IOError: The requirements can't be read.
+    """
+    site_packages = venv_site_packages(venv_dir)
+    pins, requirements = parse_requirements(requirements_file)
+
+    wheels = {}
+    try:
+        file_names = sorted(os.listdir(packages_dir))
+    except FileNotFoundError:
+        file_names = []
+    for file_name in file_names:
+        parsed = parse_wheel_name(file_name)
+        if parsed is not None and wheel_supported(*parsed[2:]):
+            wheels[parsed[:2]] = file_name
+
+    installed = installed_distributions(site_packages)
+    to_install = []
+    for name, version in sorted(pins.items()):
+        wheel = wheels.get((name, version))
+        if wheel is None:
+            requirements.append('{}=={}'.format(name, version))
+        elif wheel in reinstall or installed.get(name, (None,))[0] != version:
+            to_install.append((name, wheel))
+
+    for name, _ in to_install:
+        if name in installed:
+            print('Removing {} {}'.format(name, installed[name][0]))
+            uninstall(venv_dir, site_packages, installed[name][1])
+
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(installers) as pool:
+        futures = {pool.submit(install_wheel, os.path.join(packages_dir, wheel), venv_dir, site_packages): wheel
+                   for _, wheel in to_install}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except (UnsupportedWheel, zipfile.BadZipFile, IOError, KeyError, ValueError) as e:
+                print('Failed to install {}: {}'.format(futures[future], e))
+                failed.append(futures[future])
+
+    print('Installed {} wheels'.format(len(to_install) - len(failed)))
+    return requirements, sorted(failed)
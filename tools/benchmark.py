@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""Benchmarks of the launcher's install and version selection paths.
+
+Synthetic update packages and installation directories are generated in a
+temporary directory, the venv/pip step of the installation is skipped.
+
+Run from the repository root:
+    python -m tools.benchmark --output results.json
+    python -m tools.benchmark --baseline results.json
+"""
+import argparse
+import contextlib
+import functools
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import launch_revvy  # noqa: E402
+from package_digest import SUPPORTED_ALGORITHMS, hash_file, new_hash, remove_cache  # noqa: E402
+from update_package import extract_verified  # noqa: E402
+from version import Version, max_version  # noqa: E402
+from version_index import index_file  # noqa: E402
+from tools.benchmark_version import generate_versions  # noqa: E402
+from tools.extract_pipelined import extract_pipelined  # noqa: E402
+
+
+def make_package(directory, version, size, file_count, seed=0):
+    """Writes a 2.data/2.meta update package of about size bytes into directory."""
+    rnd = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    data_file = os.path.join(directory, '2.data')
+
+    with tarfile.open(data_file, 'w:gz') as tar:
+        def add(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        add('manifest.json', json.dumps({'version': version}).encode('utf-8'))
+        add('install/requirements.txt', b'')
+        file_size = max(1, size // file_count)
+        for i in range(file_count):
+            # half random, half repetitive content, so it compresses like source code
+            half = file_size // 2
+            data = rnd.getrandbits(8 * half).to_bytes(half, 'little') + b'revvy' * ((file_size - half) // 5)
+            add('revvy/module{}.py'.format(i), data)
+
+    with open(data_file, 'rb') as f:
+        md5 = hashlib.md5(f.read()).hexdigest()
+    with open(os.path.join(directory, '2.meta'), 'w') as f:
+        json.dump({'length': os.stat(data_file).st_size, 'md5': md5}, f)
+
+
+def make_installations(directory, count):
+    """Creates count installed versions with manifest and 'installed' sentinel."""
+    for i in range(count):
+        fw_dir = os.path.join(directory, 'revvy-0.{}.0'.format(i))
+        os.makedirs(fw_dir)
+        with open(os.path.join(fw_dir, 'manifest.json'), 'w') as f:
+            json.dump({'version': '0.{}.0'.format(i)}, f)
+        with open(os.path.join(fw_dir, 'installed'), 'w'):
+            pass
+
+
+def measure(fn, repeat, setup=None):
+    """Returns the best and median duration of fn in seconds, setup is not timed."""
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            fn()
+            durations.append(time.perf_counter() - start)
+
+    return {'best': min(durations), 'median': statistics.median(durations)}
+
+
+def benchmark_packages(work_dir, sizes, file_count, repeat):
+    results = {}
+    package_dir = os.path.join(work_dir, 'package')
+    data_dir = os.path.join(work_dir, 'ble')
+    install_dir = os.path.join(work_dir, 'install')
+
+    def restore_package():
+        shutil.rmtree(data_dir, ignore_errors=True)
+        shutil.copytree(package_dir, data_dir)
+        shutil.rmtree(install_dir, ignore_errors=True)
+        os.makedirs(install_dir)
+
+    # the venv/pip step is not what these benchmarks are about
+    setup_venv = launch_revvy.setup_venv
+    launch_revvy.setup_venv = lambda install_directory, target_dir, journal: True
+    try:
+        for size in sizes:
+            shutil.rmtree(package_dir, ignore_errors=True)
+            make_package(package_dir, '1.0.0', size, file_count)
+            restore_package()
+            name = 'package_{}k'.format(size // 1024)
+
+            data_file = os.path.join(data_dir, '2.data')
+            forget_digests = functools.partial(remove_cache, data_file)
+            for algorithm in SUPPORTED_ALGORITHMS:
+                if new_hash(algorithm) is not None:
+                    results[name + '.hash_file.' + algorithm] = measure(
+                        functools.partial(hash_file, data_file, algorithm), repeat, setup=forget_digests)
+            results[name + '.hash_file.cached'] = measure(functools.partial(hash_file, data_file, 'md5'), repeat)
+            results[name + '.has_update_package'] = measure(lambda: launch_revvy.has_update_package(data_dir), repeat)
+            results[name + '.install_update_package'] = measure(
+                lambda: launch_revvy.install_update_package(data_dir, install_dir, []), repeat, setup=restore_package)
+
+            # the extractor of the install step, compared to the single threaded one
+            package_file = os.path.join(package_dir, '2.data')
+            with open(os.path.join(package_dir, '2.meta'), 'r') as f:
+                metadata = json.load(f)
+            extract_dir = os.path.join(work_dir, 'extract')
+
+            def clear():
+                shutil.rmtree(extract_dir, ignore_errors=True)
+                remove_cache(package_file)  # measure with hashing
+
+            results[name + '.extract_verified'] = measure(
+                lambda: extract_verified(package_file, metadata['length'], metadata['md5'], extract_dir), repeat,
+                setup=clear)
+            results[name + '.extract_pipelined'] = measure(
+                lambda: extract_pipelined(package_file, metadata['length'], metadata['md5'], extract_dir, sync=False),
+                repeat, setup=clear)
+            results[name + '.extract_pipelined.sync'] = measure(
+                lambda: extract_pipelined(package_file, metadata['length'], metadata['md5'], extract_dir), repeat,
+                setup=clear)
+            results[name + '.extract_pipelined.verified'] = measure(
+                lambda: extract_pipelined(package_file, metadata['length'], metadata['md5'], extract_dir, sync=False),
+                repeat, setup=functools.partial(shutil.rmtree, extract_dir, ignore_errors=True))
+    finally:
+        launch_revvy.setup_venv = setup_venv
+
+    return results
+
+
+def benchmark_installations(work_dir, counts, repeat):
+    results = {}
+    for count in counts:
+        install_dir = os.path.join(work_dir, 'versions{}'.format(count))
+        make_installations(install_dir, count)
+        index = index_file(install_dir)
+        name = 'versions_{}'.format(count)
+
+        def drop_index():
+            if os.path.exists(index):
+                os.unlink(index)
+
+        results[name + '.select_newest_package.cold'] = measure(
+            lambda: launch_revvy.select_newest_package(install_dir, []), repeat, setup=drop_index)
+        results[name + '.select_newest_package'] = measure(
+            lambda: launch_revvy.select_newest_package(install_dir, []), repeat)
+        results[name + '.cleanup_invalid_installations'] = measure(
+            lambda: launch_revvy.cleanup_invalid_installations(install_dir), repeat)
+
+    return results
+
+
+def benchmark_version(count, repeat):
+    ver_strs = generate_versions(count)
+    parsed = Version.parse_many(ver_strs)
+    return {
+        'version.parse_many': measure(lambda: Version.parse_many(ver_strs), repeat),
+        'version.sort': measure(lambda: sorted(parsed), repeat),
+        'version.max_version': measure(lambda: max_version(parsed), repeat),
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints the change of each result relative to the baseline.
+
+    Returns:
+        True if any benchmark got slower than the threshold allows.
+    """
+    regression = False
+    print('{:<60} {:>12} {:>12} {:>8}'.format('Benchmark', 'Baseline', 'Current', 'Change'))
+    for name in sorted(results):
+        current = results[name]['median']
+        if name not in baseline:
+            print('{:<60} {:>12} {:>10.3f}ms'.format(name, '-', current * 1000))
+            continue
+
+        old = baseline[name]['median']
+        change = current / old - 1 if old > 0 else 0.0
+        flag = ''
+        if change > threshold:
+            flag = ' REGRESSION'
+            regression = True
+        print('{:<60} {:>10.3f}ms {:>10.3f}ms {:>+7.0%}{}'.format(name, old * 1000, current * 1000, change, flag))
+
+    return regression
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix='revvy-benchmark-')
+    try:
+        results = {}
+        results.update(benchmark_packages(work_dir, [size * 1024 for size in args.package_sizes],
+                                          args.file_count, args.repeat))
+        results.update(benchmark_installations(work_dir, args.version_counts, args.repeat))
+        results.update(benchmark_version(args.version_strings, args.repeat))
+    finally:
+        shutil.rmtree(work_dir)
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+    else:
+        for name in sorted(results):
+            print('{:<60} {:>10.3f}ms'.format(name, results[name]['median'] * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--output', help='Write results to this json file')
+    parser.add_argument('--baseline', help='Compare results to this json file, exit with 1 on regression')
+    parser.add_argument('--threshold', help='Relative slowdown reported as regression', type=float, default=0.2)
+    parser.add_argument('--repeat', help='Number of repetitions', type=int, default=5)
+    parser.add_argument('--package-sizes', help='Update package sizes in KiB', type=int, nargs='+',
+                        default=[1024, 16 * 1024])
+    parser.add_argument('--file-count', help='Number of files in an update package', type=int, default=200)
+    parser.add_argument('--version-counts', help='Number of installed versions', type=int, nargs='+',
+                        default=[1, 10, 100, 1000])
+    parser.add_argument('--version-strings', help='Number of version strings to parse', type=int, default=20000)
+
+    main(parser.parse_args())
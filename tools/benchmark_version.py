@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+"""Microbenchmark of Version parsing, comparison and sorting.
+
+Run from the repository root: python -m tools.benchmark_version
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import version  # noqa: E402
+from version import Version  # noqa: E402
+
+
+def generate_versions(count, seed=0):
+    rnd = random.Random(seed)
+    return ['{}.{}.{}'.format(rnd.randint(0, 9), rnd.randint(0, 99), rnd.randint(0, 999)) for _ in range(count)]
+
+
+def pairwise_max(versions):
+    newest = versions[0]
+    for v in versions[1:]:
+        if newest < v:
+            newest = v
+    return newest
+
+
+def benchmarks(ver_strs):
+    parsed = [Version(s) for s in ver_strs]
+
+    def parse_cold():
+        getattr(version, '_cache', {}).clear()
+        return [Version(s) for s in ver_strs]
+
+    cases = [
+        ('parse (cold)', parse_cold),
+        ('parse', lambda: [Version(s) for s in ver_strs]),
+        ('sort', lambda: sorted(parsed)),
+        ('pairwise max', lambda: pairwise_max(parsed)),
+    ]
+    if hasattr(Version, 'parse_many'):
+        cases += [
+            ('parse_many', lambda: Version.parse_many(ver_strs)),
+            ('sort by key', lambda: sorted(parsed, key=lambda v: v.key)),
+            ('max_version', lambda: version.max_version(parsed)),
+        ]
+    return cases
+
+
+def main(count, repeat):
+    ver_strs = generate_versions(count)
+    print('{} versions, best of {}'.format(count, repeat))
+    for name, fn in benchmarks(ver_strs):
+        best = min(timeit.repeat(fn, number=1, repeat=repeat))
+        print('{:<15} {:10.3f} ms'.format(name, best * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', help='Number of versions', type=int, default=20000)
+    parser.add_argument('--repeat', help='Number of repetitions', type=int, default=5)
+
+    args = parser.parse_args()
+
+    main(args.count, args.repeat)
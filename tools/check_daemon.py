@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+"""Checks the control socket and the update watcher of the launcher daemon.
+
+Starts a Daemon in a temporary directory and sends it commands with the
+client of tools/launcher_control.py: while the launcher waits, while a
+framework process runs, and after an update package is uploaded. Exits
+with 1 if any check fails.
+
+Run from the repository root:
+    python -m tools.check_daemon
+"""
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from background_install import BackgroundInstaller  # noqa: E402
+from daemon import Daemon  # noqa: E402
+from supervisor import Supervisor  # noqa: E402
+from tools.launcher_control import send_command  # noqa: E402
+
+
+# stands in for the framework, it runs until the daemon stops it
+FRAMEWORK = 'import time\ntime.sleep(30)\n'
+
+# stands in for the launcher started with --install-only by the installer
+INSTALLER = 'import sys\nsys.exit(0)\n'
+
+
+class Checker:
+    def __init__(self):
+        self.failed = []
+
+    def check(self, name, condition, details=None):
+        print('{}: {}'.format(name, 'ok' if condition else 'FAILED'))
+        if not condition:
+            print('    {}'.format(details))
+            self.failed.append(name)
+
+
+def upload_package(data_directory):
+    with open(os.path.join(data_directory, '2.data'), 'wb') as f:
+        f.write(b'\0' * 1024)
+    with open(os.path.join(data_directory, '2.meta'), 'w') as f:
+        json.dump({'length': 1024, 'md5': ''}, f)
+
+
+def check_daemon(work_dir, checker):
+    data_directory = os.path.join(work_dir, 'ble')
+    socket_path = os.path.join(work_dir, 'launcher.sock')
+    installer_script = os.path.join(work_dir, 'installer.py')
+    framework_script = os.path.join(work_dir, 'revvy.py')
+    with open(installer_script, 'w') as f:
+        f.write(INSTALLER)
+    with open(framework_script, 'w') as f:
+        f.write(FRAMEWORK)
+
+    supervisor = Supervisor()
+    installer = BackgroundInstaller(installer_script, work_dir)
+    skipped_versions = []
+    daemon = Daemon(data_directory, socket_path, installer, skipped_versions)
+    daemon.start(supervisor)
+    try:
+        # the launcher is waiting, e.g. for AMP_EN
+        response = daemon.call_blocking(send_command, socket_path, 'status')
+        checker.check('status while waiting', response.get('ok') and response['version'] is None
+                      and response['installer'] == 'idle' and not response['update_pending'], response)
+
+        response = daemon.call_blocking(send_command, socket_path, 'restart')
+        checker.check('restart without framework', response == {'ok': False}, response)
+
+        response = daemon.call_blocking(send_command, socket_path, 'unknown')
+        checker.check('unknown command', not response.get('ok') and 'error' in response, response)
+
+        response = daemon.call_blocking(send_command, socket_path, 'install-now')
+        checker.check('install-now without update', response == {'ok': False}, response)
+
+        # an upload finishes while the launcher sleeps, e.g. before restarting the framework
+        upload_package(data_directory)
+        daemon.sleep(0.5)
+        checker.check('upload detected while sleeping', daemon.counters['updates_detected'] == 1
+                      and daemon.counters['installs_started'] == 1, daemon.counters)
+        daemon.sleep(0.5)
+
+        response = daemon.call_blocking(send_command, socket_path, 'status')
+        checker.check('installer finished', response.get('installer') == 'finished', response)
+
+        # the framework runs
+        responses = []
+
+        async def client(process):
+            loop = asyncio.get_event_loop()
+            responses.append(await loop.run_in_executor(None, send_command, socket_path, 'status'))
+            responses.append(await loop.run_in_executor(None, send_command, socket_path, 'metrics'))
+            responses.append(await loop.run_in_executor(None, send_command, socket_path, 'skip-version'))
+
+        result = supervisor.run([sys.executable, framework_script], tasks=[daemon.tracker(work_dir), client])
+        status, metrics, skip = responses + [None] * (3 - len(responses))
+        checker.check('status while running', status is not None and status.get('version') == work_dir
+                      and status.get('pid') is not None, status)
+        checker.check('metrics while running', metrics is not None and metrics.get('framework_starts') == 1
+                      and metrics.get('commands', 0) >= 6, metrics)
+        checker.check('skip-version stops the framework', skip == {'ok': True} and result.runtime < 20
+                      and skipped_versions == [work_dir], (skip, result, skipped_versions))
+    finally:
+        daemon.close()
+        supervisor.close()
+
+    checker.check('socket removed', not os.path.exists(socket_path), socket_path)
+
+
+def main():
+    checker = Checker()
+    work_dir = tempfile.mkdtemp(prefix='check_daemon_')
+    try:
+        check_daemon(work_dir, checker)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if checker.failed:
+        print('Failed checks: {}'.format(', '.join(checker.failed)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
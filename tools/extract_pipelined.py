@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""An experimental update package extractor, that writes files on multiple threads.
+
+The launcher uses update_package.extract_verified. On a single core the
+writer threads make extraction 5-10% slower, so extract_pipelined is kept
+here to be measured with tools/benchmark.py on multi-core boards with slow
+storage, before it is considered for the launcher.
+"""
+import concurrent.futures
+import os
+import sys
+import tarfile
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from trash import move_to_trash, trash_directory  # noqa: E402
+from update_package import CHUNK_SIZE, EXTRACT_FILTER, _check_package, _checked_member, _open_package  # noqa: E402
+
+
+# number of threads writing extracted files, and the number of files that may wait for them
+EXTRACT_WRITERS = 4
+EXTRACT_QUEUE_LENGTH = 32
+
+# larger files are written by the reading thread, so that the queue does not hold too much memory
+MAX_QUEUED_FILE_SIZE = 1024 * 1024
+
+
+def _write_member(tar, member, path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    tar.chown(member, path, False)
+    tar.chmod(member, path)
+    tar.utime(member, path)
+
+
+def extract_pipelined(package_file, expected_length, expected_digest, destination, writers=EXTRACT_WRITERS, sync=True,
+                      algorithm='md5'):
+    """Verifies and extracts an update package, writing files on multiple threads.
+
+    Works like extract_verified, but only decompression, hashing and parsing
+    happen on the calling thread. The contents of regular files are handed
+    to a pool of writer threads, so that decompression is not held up by the
+    storage and vice versa. Hard links are created after every file has been
+    written, since their target may still be in the queue.
+    With sync, the extracted files are flushed to the storage by a single
+    os.sync() at the end, which is much cheaper on SD cards than an fsync of
+    every file.
+    The threads only pay off with multiple cores and slow storage, compare
+    it with extract_verified with tools/benchmark.py.
+
+    Args:
+        package_file: Path to the gzipped tar update package.
+        expected_length: Size of the package in bytes, from the metadata.
+        expected_digest: Hex digest of the package, from the metadata.
+        destination: Directory to extract the package into.
+        writers: Number of writer threads.
+        sync: Flush the extracted files before returning.
+        algorithm: Hash algorithm of expected_digest.
+
+    Raises:
+        VerificationError: The package does not match the metadata or
+            contains a member that would be extracted outside destination.
+        tarfile.TarError, ValueError: The package is not a valid archive.
+        IOError: An error occurred during reading the package or writing the
+            extracted files.
+    """
+    directories = [(destination, None)]
+    files = set()
+    links = []
+    futures = []
+    queued = threading.BoundedSemaphore(EXTRACT_QUEUE_LENGTH)
+
+    def dequeued(future):
+        queued.release()
+
+    try:
+        os.makedirs(destination, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(writers) as pool:
+            f, reader = _open_package(package_file, expected_digest, algorithm)
+            with f:
+                with tarfile.open(fileobj=reader, mode='r|gz', bufsize=CHUNK_SIZE) as tar:
+                    for member in tar:
+                        member, member_path = _checked_member(destination, member)
+
+                        if member_path in files or member.issym():
+                            # a later member replaces the file, or links to a directory the queued files are
+                            # written into, don't let them race
+                            concurrent.futures.wait(futures)
+
+                        if member.isdir():
+                            # restore permissions at the end, like extract_verified
+                            directories.append((member_path, member.mode))
+                            os.makedirs(member_path, exist_ok=True)
+                        elif member.islnk():
+                            links.append((member, member_path, os.path.join(destination, member.linkname)))
+                        elif member.isfile() and member.size <= MAX_QUEUED_FILE_SIZE:
+                            data = tar.extractfile(member).read()
+                            queued.acquire()
+                            future = pool.submit(_write_member, tar, member, member_path, data)
+                            future.add_done_callback(dequeued)
+                            futures.append(future)
+                            files.add(member_path)
+                        else:
+                            # large files, symbolic links and special files
+                            tar.extract(member, destination, **EXTRACT_FILTER)
+                            if member.isfile():
+                                files.add(member_path)
+                reader.drain()
+
+            _check_package(package_file, reader, expected_length, expected_digest, algorithm)
+
+            for future in futures:
+                future.result()
+
+            for member, path, target in links:
+                if os.path.lexists(path):
+                    os.unlink(path)
+                os.link(target, path)
+                # like tarfile, apply the attributes of the link to the shared file
+                tar.chown(member, path, False)
+                tar.chmod(member, path)
+                tar.utime(member, path)
+
+            for path, mode in reversed(directories):
+                if mode is not None:
+                    os.chmod(path, mode)
+
+            if sync:
+                os.sync()
+    except BaseException:
+        move_to_trash(destination, trash_directory(os.path.dirname(destination)))
+        raise
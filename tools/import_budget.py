@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Checks that importing the launcher stays fast.
+
+Imports launch_revvy in fresh interpreters with -X importtime and fails if
+the median import time exceeds the budget, or if a module that should only
+be loaded when it is needed is imported at startup. Requires python 3.7.
+
+Run from the repository root:
+    python -m tools.import_budget
+    python -m tools.import_budget --budget 40 --repeat 9
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+
+# modules that are imported where they are used, see launch_revvy.py
+LAZY_MODULES = [
+    'argparse', 'asyncio', 'concurrent.futures', 'ctypes', 'hashlib', 'shutil', 'socket', 'subprocess', 'tarfile',
+    'tempfile', 'traceback',
+    'background_install', 'daemon', 'delta', 'object_store', 'supervisor', 'update_package', 'venv_reuse',
+    'resource_monitor', 'wheel_install', 'zipfile'
+]
+
+
+def import_times(module):
+    """Imports module in a new interpreter.
+
+    Returns:
+        A dict of the cumulative import time of every imported module in
+        microseconds.
+    """
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)  # startup is measured with compiled modules
+    output = subprocess.check_output([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                     cwd=SRC_DIR, env=env, stderr=subprocess.STDOUT, universal_newlines=True)
+
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(args):
+    if sys.version_info < (3, 7):
+        print('-X importtime requires python 3.7, skipping')
+        return
+
+    # the first run compiles the modules
+    times = import_times('launch_revvy')
+
+    durations = [import_times('launch_revvy')['launch_revvy'] / 1000 for _ in range(args.repeat)]
+    median = statistics.median(durations)
+    print('Importing launch_revvy took {:.1f}ms (median of {}), budget {:.1f}ms'.format(
+        median, args.repeat, args.budget))
+
+    failed = False
+    loaded = [module for module in LAZY_MODULES if module in times]
+    if loaded:
+        print('Modules that should be imported when needed are imported at startup: {}'.format(', '.join(loaded)))
+        failed = True
+
+    if median > args.budget:
+        print('Import time is over budget')
+        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--budget', help='Import time limit in milliseconds', type=float, default=50.0)
+    parser.add_argument('--repeat', help='Number of measurements', type=int, default=5)
+
+    main(parser.parse_args())
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""Client of the control socket of a launcher running with --daemon.
+
+Run from the repository root:
+    python -m tools.launcher_control status
+    python -m tools.launcher_control --socket src/user/launcher.sock skip-version
+"""
+import argparse
+import json
+import socket
+import sys
+
+
+DEFAULT_SOCKET = 'src/user/launcher.sock'
+
+
+def send_command(socket_path, command, timeout=5.0):
+    """Sends a command to the launcher.
+
+    Args:
+        socket_path: Path of the control socket.
+        command: One of status, install-now, restart, skip-version, metrics.
+        timeout: Seconds to wait for the connection and the answer.
+
+    Returns:
+        The answer of the launcher as a dict.
+
+    Raises:
+        OSError: The launcher is not running or did not answer in time.
+        ValueError: The answer is not valid json.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(command.encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+
+    if not line:
+        raise OSError('The launcher closed the connection')
+    return json.loads(line.decode('utf-8'))
+
+
+def main(args):
+    try:
+        response = send_command(args.socket, args.command)
+    except (OSError, ValueError) as e:
+        print('Failed to send {}: {}'.format(args.command, e))
+        sys.exit(2)
+
+    print(json.dumps(response, indent=2, sort_keys=True))
+    if not response.get('ok'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=['status', 'install-now', 'restart', 'skip-version', 'metrics'])
+    parser.add_argument('--socket', help='Path of the control socket', default=DEFAULT_SOCKET)
+
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""Creates a delta update package (2.data and 2.meta) between two framework trees.
+
+Files that are identical in the base tree (by content, so renames are
+detected too) are referenced, files that changed are shipped as fixed size
+blocks that are either taken from the base file or from the package, new files
+are shipped whole.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from package_digest import hash_file  # noqa: E402
+
+
+BLOCK_SIZE = 4096
+
+
+def list_files(root):
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        # the virtualenv is created on the device, never part of a package
+        dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != os.path.join(root, 'install', 'venv')]
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.isfile(path) and not os.path.islink(path):
+                files[os.path.relpath(path, root)] = path
+    return files
+
+
+def block_delta(base_path, new_path):
+    """Returns the block list and the patch data of new_path against base_path."""
+    base_blocks = {}
+    with open(base_path, 'rb') as f:
+        offset = 0
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            base_blocks.setdefault(hashlib.md5(block).digest(), (offset, block))
+            offset += len(block)
+
+    blocks = []
+    patch = io.BytesIO()
+    with open(new_path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            match = base_blocks.get(hashlib.md5(block).digest())
+            if match is not None and match[1] == block:
+                source, offset = 'base', match[0]
+            else:
+                source, offset = 'patch', patch.tell()
+                patch.write(block)
+
+            if blocks and blocks[-1][0] == source and blocks[-1][1] + blocks[-1][2] == offset:
+                blocks[-1][2] += len(block)
+            else:
+                blocks.append([source, offset, len(block)])
+
+    return blocks, patch.getvalue()
+
+
+def main(base_dir, base_version, new_dir, output_dir):
+    base_files = list_files(base_dir)
+    base_by_hash = {}
+    for path in sorted(base_files):
+        base_by_hash.setdefault(hash_file(base_files[path], 'md5', cache=False), path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    data_file = os.path.join(output_dir, '2.data')
+
+    files = {}
+    with tarfile.open(data_file, 'w:gz') as tar:
+        def add_bytes(name, data):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+        for path, full_path in sorted(list_files(new_dir).items()):
+            md5 = hash_file(full_path, 'md5', cache=False)
+            entry = {'md5': md5, 'mode': os.stat(full_path).st_mode & 0o7777}
+            if md5 in base_by_hash:
+                entry['source'] = 'base'
+                if base_by_hash[md5] != path:
+                    entry['base_path'] = base_by_hash[md5]
+            elif path in base_files:
+                blocks, patch = block_delta(base_files[path], full_path)
+                entry['source'] = 'blocks'
+                entry['blocks'] = blocks
+                add_bytes('files/{}'.format(path), patch)
+            else:
+                entry['source'] = 'patch'
+                tar.add(full_path, 'files/{}'.format(path))
+            files[path] = entry
+
+        add_bytes('delta.json', json.dumps({'files': files}, indent=1).encode('utf-8'))
+
+    with open(os.path.join(output_dir, '2.meta'), 'w') as meta:
+        json.dump({'length': os.stat(data_file).st_size, 'md5': hash_file(data_file, 'md5', cache=False),
+                   'base': base_version}, meta)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('base_dir', help='Framework tree of the installed base version')
+    parser.add_argument('base_version', help='Version of the base framework')
+    parser.add_argument('new_dir', help='Framework tree of the new version')
+    parser.add_argument('output_dir', help='Directory to write 2.data and 2.meta into')
+
+    args = parser.parse_args()
+
+    main(args.base_dir, args.base_version, args.new_dir, args.output_dir)
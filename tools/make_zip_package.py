@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""Creates an archive update package (2.data and 2.meta) from a framework tree.
+
+The framework runs directly from the archive, see src/framework_archive.py.
+revvy.py becomes the __main__.py of the archive, unless the tree has one.
+Wheels are stored uncompressed, they are compressed already.
+Native extensions are only supported at the top level of the tree, the
+launcher rejects packages with native extensions inside a package.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from framework_archive import is_native_in_package  # noqa: E402
+
+
+# zip archives can't store older modification times
+ZIP_EPOCH = 315532800  # 1980-01-01
+
+
+def file_digest(path, algorithm):
+    hash_fn = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            hash_fn.update(chunk)
+    return hash_fn.hexdigest()
+
+
+def add_file(zf, path, arcname, compression):
+    st = os.stat(path)
+    info = zipfile.ZipInfo(arcname, time.localtime(max(st.st_mtime, ZIP_EPOCH))[:6])
+    info.external_attr = (st.st_mode & 0xFFFF) << 16
+    info.compress_type = compression
+    with open(path, 'rb') as f:
+        zf.writestr(info, f.read())
+
+
+def main(framework_dir, output_dir, algorithms):
+    os.makedirs(output_dir, exist_ok=True)
+    data_file = os.path.join(output_dir, '2.data')
+
+    members = []
+    for root, dirs, files in os.walk(framework_dir):
+        dirs[:] = sorted(d for d in dirs if d not in ('__pycache__', 'venv'))
+        for name in sorted(files):
+            if name.endswith('.pyc'):
+                continue
+            path = os.path.join(root, name)
+            arcname = os.path.relpath(path, framework_dir).replace(os.sep, '/')
+            if is_native_in_package(arcname):
+                raise SystemExit('Native extension inside a package: {}'.format(arcname))
+            members.append((path, arcname))
+
+    with zipfile.ZipFile(data_file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for path, arcname in members:
+            compression = zipfile.ZIP_STORED if arcname.endswith('.whl') else zipfile.ZIP_DEFLATED
+            add_file(zf, path, arcname, compression)
+
+        if not os.path.isfile(os.path.join(framework_dir, '__main__.py')):
+            add_file(zf, os.path.join(framework_dir, 'revvy.py'), '__main__.py', zipfile.ZIP_DEFLATED)
+
+    metadata = {'length': os.stat(data_file).st_size, 'format': 'zip'}
+    for algorithm in algorithms:
+        metadata[algorithm] = file_digest(data_file, algorithm)
+
+    with open(os.path.join(output_dir, '2.meta'), 'w') as meta:
+        json.dump(metadata, meta)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('framework_dir', help='Framework tree, containing manifest.json and revvy.py')
+    parser.add_argument('output_dir', help='Directory to write 2.data and 2.meta into')
+    parser.add_argument('--digest', help='Digests to declare in the metadata', nargs='+',
+                        choices=['md5', 'sha256', 'blake2b'], default=['md5', 'sha256'])
+
+    args = parser.parse_args()
+
+    main(args.framework_dir, args.output_dir, args.digest)
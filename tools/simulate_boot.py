@@ -0,0 +1,297 @@
+#!/usr/bin/env python
+"""Simulates boots of the launcher, without a board, a virtualenv or a framework.
+
+Runs launch_revvy.startup in a temporary launcher directory with:
+- a virtual clock: waiting (AMP_EN, readiness checks, restart backoff, the
+  framework running) advances it instantly, the work of the launcher is
+  measured in real time,
+- a scripted AMP_EN timeline,
+- a fake framework that exits with scripted exit codes after a scripted
+  runtime,
+- a fake virtualenv setup: venv, pip and compile commands succeed at once,
+- a fake trash reclaimer, that leaves the trash alone.
+
+Prints the boot trace of every boot, with the simulated time of each phase.
+
+Run from the repository root:
+    python -m tools.simulate_boot boot
+    python -m tools.simulate_boot update --exit-codes 1 0
+    python -m tools.simulate_boot integrity-skip --amp-en 0:0 2.5:1
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import launch_revvy  # noqa: E402
+from gpio import GpioBackend  # noqa: E402
+from supervisor import ProcessResult  # noqa: E402
+from version import Version  # noqa: E402
+from tools.benchmark import make_package  # noqa: E402
+
+
+SCENARIOS = ('boot', 'update', 'integrity-skip')
+
+# seconds a framework runs before exiting with the scripted code
+DEFAULT_RUNTIME = 10.0
+
+
+class VirtualClock:
+    """Time that passes like real time, but skips over every sleep."""
+
+    def __init__(self):
+        self._origin = time.monotonic()
+        self._epoch = time.time()
+        self.skipped = 0.0
+
+    def monotonic(self):
+        return time.monotonic() - self._origin + self.skipped
+
+    def time(self):
+        return self._epoch + self.monotonic()
+
+    def sleep(self, seconds):
+        self.skipped += max(0.0, seconds)
+
+
+class ScriptedGpio(GpioBackend):
+    """AMP_EN follows a timeline of (simulated time, value) pairs, other pins are low."""
+
+    def __init__(self, timeline, clock):
+        self._timeline = sorted(timeline)
+        self._clock = clock
+
+    def configure_input(self, pin):
+        pass
+
+    def read(self, pin):
+        if pin != launch_revvy.AMP_EN_PIN:
+            return False
+        value = False
+        for at, high in self._timeline:
+            if at <= self._clock.monotonic():
+                value = high
+        return value
+
+    def wait_for_high(self, pin, timeout=None):
+        if self.read(pin):
+            return True
+        for at, high in self._timeline:
+            if high and at > self._clock.monotonic():
+                wait = at - self._clock.monotonic()
+                if timeout is not None and wait > timeout:
+                    break
+                self._clock.sleep(wait)
+                return True
+        self._clock.sleep(timeout or 0.0)
+        return False
+
+
+class FakeProcess:
+    """The SupervisedProcess passed to the tasks of a fake framework run."""
+
+    def __init__(self, args, clock):
+        self.args = args
+        self.pid = os.getpid()
+        self.started = clock.monotonic()
+        self.last_output = self.started
+        self.output = []
+        self._clock = clock
+
+    @property
+    def runtime(self):
+        return self._clock.monotonic() - self.started
+
+    async def terminate(self, timeout=5.0):
+        pass
+
+
+class FakeSupervisor:
+    """Runs no processes: the framework exits as scripted, setup commands succeed.
+
+    Args:
+        clock: The VirtualClock.
+        exits: List of (exit code, runtime) of the framework runs, the
+            framework exits with 0 once it's used up.
+        setup_time: Simulated seconds taken by each setup command.
+    """
+
+    def __init__(self, clock, exits, setup_time=0.0):
+        self._clock = clock
+        self._exits = list(exits)
+        self._setup_time = setup_time
+        self._loop = asyncio.new_event_loop()
+        self.runs = []
+
+    def run(self, args, tasks=(), cwd=None, env=None):
+        if os.path.basename(args[-1]) not in ('revvy.py', launch_revvy.ARCHIVE_FILE):
+            if args[1:3] == ['-m', 'venv']:
+                # installation checks that the interpreter of the virtualenv exists
+                os.makedirs(os.path.join(args[3], 'bin'), exist_ok=True)
+                open(os.path.join(args[3], 'bin', 'python3'), 'w').close()
+            self._clock.sleep(self._setup_time)
+            return ProcessResult(0, self._setup_time, [])
+
+        returncode, runtime = self._exits.pop(0) if self._exits else (0, DEFAULT_RUNTIME)
+        self.runs.append((os.path.dirname(args[-1]), returncode))
+
+        # let the tasks see the start of the process, e.g. to end the boot trace
+        process = FakeProcess(args, self._clock)
+        background = [self._loop.create_task(task(process)) for task in tasks]
+        self._loop.run_until_complete(asyncio.sleep(0))
+        for task in background:
+            task.cancel()
+        if background:
+            self._loop.run_until_complete(asyncio.wait(background))
+
+        self._clock.sleep(runtime)
+        return ProcessResult(returncode, runtime, [])
+
+    def run_until_complete(self, coroutine):
+        return self._loop.run_until_complete(coroutine)
+
+    def close(self):
+        self._loop.close()
+
+
+class FakeReclaimer:
+    """Starts no process to empty the trash, only counts how often it would."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.starts = 0
+
+    def start(self):
+        self.starts += 1
+
+    @property
+    def running(self):
+        return False
+
+
+def make_version(directory, version):
+    """Creates an installed framework version with a fake virtualenv."""
+    path = os.path.join(directory, launch_revvy.dir_for_version(Version(version)))
+    os.makedirs(os.path.join(path, 'install', 'venv', 'bin'))
+    open(os.path.join(path, 'install', 'venv', 'bin', 'python3'), 'w').close()
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        json.dump({'version': version, 'readiness': {'checks': [], 'timeout': 0}}, f)
+    open(os.path.join(path, 'revvy.py'), 'w').close()
+    open(os.path.join(path, 'installed'), 'w').close()
+
+
+def prepare(directory, scenario, package_size, file_count):
+    """Creates the launcher directory of a scenario."""
+    make_version(os.path.join(directory, launch_revvy.default_package_dir), '0.1.0')
+    os.makedirs(os.path.join(directory, launch_revvy.installed_packages_dir))
+    os.makedirs(os.path.join(directory, 'user', 'ble'))
+
+    if scenario == 'update':
+        make_package(os.path.join(directory, 'user', 'ble'), '1.0.0', package_size, file_count)
+    elif scenario == 'integrity-skip':
+        make_version(os.path.join(directory, launch_revvy.installed_packages_dir), '1.0.0')
+
+
+def read_boots(trace_file):
+    """Splits the boot trace into boots, each one a list of spans."""
+    boots = [[]]
+    with open(trace_file, 'r') as f:
+        for line in f:
+            record = json.loads(line)
+            boots[-1].append(record)
+            if record['name'] == 'total':
+                boots.append([])
+    return [boot for boot in boots if boot]
+
+
+def report(boots, runs, reclaimers, clock, real_time):
+    lines = []
+    for number, boot in enumerate(boots, 1):
+        lines.append('Boot {}'.format(number))
+        lines.append('  {:<30} {:>11} {:>11}'.format('Phase', 'Start [ms]', 'Time [ms]'))
+        for record in boot:
+            lines.append('  {:<30} {:>11.1f} {:>11.1f}'.format(
+                '  ' * record['depth'] + record['name'], record['start'] * 1000, record['duration'] * 1000))
+    lines.append('Framework runs: {}'.format(
+        ', '.join('{} exited with {}'.format(os.path.basename(path), code) for path, code in runs)))
+    lines.append('Trash emptied: {} times'.format(sum(reclaimer.starts for reclaimer in reclaimers)))
+    lines.append('Simulated time: {:.3f}s, real time: {:.3f}s'.format(clock.monotonic(), real_time))
+    return '\n'.join(lines)
+
+
+def simulate(scenario, exits, amp_en, setup_time=0.0, package_size=1024 * 1024, file_count=100, verbose=False):
+    """Runs the launcher through a scenario.
+
+    Returns:
+        The report as a string.
+    """
+    work_dir = tempfile.mkdtemp(prefix='simulate_boot_')
+    cwd = os.getcwd()
+    try:
+        prepare(work_dir, scenario, package_size, file_count)
+        os.chdir(work_dir)  # the default package directory is relative
+
+        clock = VirtualClock()
+        supervisor = FakeSupervisor(clock, exits, setup_time)
+        reclaimers = []
+
+        def make_reclaimer(directory):
+            reclaimers.append(FakeReclaimer(directory))
+            return reclaimers[-1]
+
+        log = sys.stdout if verbose else io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            launch_revvy.startup(work_dir, argv=[], gpio=ScriptedGpio(amp_en, clock), supervisor=supervisor,
+                                 clock=clock.monotonic, wall_clock=clock.time, sleep=clock.sleep,
+                                 trash_reclaimer=make_reclaimer)
+        real_time = time.perf_counter() - start
+
+        boots = read_boots(os.path.join(work_dir, 'user', 'boot_trace.jsonl'))
+        return report(boots, supervisor.runs, reclaimers, clock, real_time)
+    finally:
+        os.chdir(cwd)
+        launch_revvy._supervisor = None
+        launch_revvy._reclaimers.clear()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def parse_event(text):
+    at, _, value = text.partition(':')
+    return float(at), value.strip() == '1'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('scenario', choices=SCENARIOS,
+                        help='boot: only the default version is installed, update: an update package is waiting,'
+                             ' integrity-skip: the installed version is broken')
+    parser.add_argument('--exit-codes', type=int, nargs='+',
+                        help='Exit codes of the framework runs, 0 once they are used up. Defaults to 0 for boot and'
+                             ' update, and 2 then 0 for integrity-skip')
+    parser.add_argument('--runtime', type=float, default=DEFAULT_RUNTIME,
+                        help='Simulated seconds each framework run takes')
+    parser.add_argument('--amp-en', type=parse_event, nargs='+', default=[(0.0, False), (1.0, True)],
+                        metavar='TIME:VALUE', help='AMP_EN timeline in simulated seconds, default: 0:0 1:1')
+    parser.add_argument('--setup-time', type=float, default=0.0,
+                        help='Simulated seconds each venv, pip and compile command takes')
+    parser.add_argument('--package-size', type=int, default=1024, help='Size of the update package in KiB')
+    parser.add_argument('--file-count', type=int, default=100, help='Number of files in the update package')
+    parser.add_argument('--verbose', action='store_true', help='Print the output of the launcher')
+
+    args = parser.parse_args()
+
+    exit_codes = args.exit_codes
+    if exit_codes is None:
+        exit_codes = [2, 0] if args.scenario == 'integrity-skip' else [0]
+
+    print(simulate(args.scenario, [(code, args.runtime) for code in exit_codes], args.amp_en, args.setup_time,
+                   args.package_size * 1024, args.file_count, args.verbose))